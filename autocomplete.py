@@ -0,0 +1,189 @@
+import os
+import gzip
+import json
+import heapq
+import argparse
+import threading
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from pagecache import LRUCache, normalize_key
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from wiki import WikipediaAPI
+
+class TitleIndex:
+    TOP_K = 10 # Suggestions precomputed for very short prefixes
+    SHORT_PREFIX = 2 # Prefixes up to this length are answered from the precomputed table
+    SCAN_LIMIT = 5000 # Candidates ranked per lookup for longer prefixes
+
+    def __init__(self, entries: list[tuple[str, int, str]] = ()):
+        entries = sorted(entries, key=lambda entry: (entry[0].casefold(), entry[0]))
+        self.folded = [title.casefold() for title, _, _ in entries]
+        self.titles = [title for title, _, _ in entries]
+        self.popularity = array("I", [popularity for _, popularity, _ in entries])
+        self.descriptions = [description for _, _, description in entries]
+        self.short: dict[str, list[int]] = self._build_short_prefixes()
+
+    @classmethod
+    def from_file(cls, path: str) -> 'TitleIndex':
+        # One title per line, optionally followed by tab separated popularity and description
+        entries = []
+        with open(path, "r", encoding="utf-8") as titles_file:
+            for line in titles_file:
+                fields = line.rstrip("\n").split("\t")
+                if fields[0] == "":
+                    continue
+                popularity = int(fields[1]) if len(fields) > 1 and fields[1].isdigit() else 0
+                description = fields[2] if len(fields) > 2 else ""
+                entries.append((fields[0].replace("_", " "), popularity, description))
+        return cls(entries)
+
+    def _build_short_prefixes(self) -> dict[str, list[int]]:
+        heaps: dict[str, list[tuple[int, int]]] = {}
+        for position, folded in enumerate(self.folded):
+            for length in range(1, min(self.SHORT_PREFIX, len(folded)) + 1):
+                heap = heaps.setdefault(folded[:length], [])
+                item = (self.popularity[position], -position)
+                if len(heap) < self.TOP_K:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+        return {prefix: [-position for _, position in sorted(heap, reverse=True)] for prefix, heap in heaps.items()}
+
+    def _suggestion(self, position: int) -> dict:
+        return {
+            "title": self.titles[position],
+            "key": normalize_key(self.titles[position]),
+            "description": self.descriptions[position]
+        }
+
+    def suggest(self, prefix: str, limit: int = TOP_K) -> list[dict]:
+        folded = prefix.replace("_", " ").casefold()
+        if folded == "":
+            return []
+        if len(folded) <= self.SHORT_PREFIX:
+            return [self._suggestion(position) for position in self.short.get(folded, [])[:limit]]
+
+        start = bisect_left(self.folded, folded)
+        end = start
+        while end < len(self.folded) and end - start < self.SCAN_LIMIT and self.folded[end].startswith(folded):
+            end += 1
+        best = heapq.nlargest(limit, range(start, end), key=lambda position: self.popularity[position])
+        return [self._suggestion(position) for position in best]
+
+    def exact(self, title: str) -> dict|None:
+        folded = title.replace("_", " ").casefold()
+        position = bisect_left(self.folded, folded)
+        if position < len(self.folded) and self.folded[position] == folded:
+            return self._suggestion(position)
+        return None
+
+    def __len__(self):
+        return len(self.titles)
+
+class Autocomplete:
+    LIMIT = 8
+    CACHE_BYTES = 8 * 1024 * 1024
+    CACHE_TTL = 60 * 60
+    REMOTE_MIN_LENGTH = 3 # Shorter prefixes match too much to be worth an upstream search
+    REMOTE_WORKERS = 2 # Upstream searches get their own threads so they never hold up navigation lookups
+
+    def __init__(self, wikipedia_api: 'WikipediaAPI', index: TitleIndex = None):
+        self.wikipedia_api = wikipedia_api
+        self.index = index if index is not None else TitleIndex()
+        self.remote = LRUCache(self.CACHE_BYTES, self.CACHE_TTL) # Upstream search results by folded query
+        self.workers = ThreadPoolExecutor(max_workers=self.REMOTE_WORKERS, thread_name_prefix="autocomplete")
+        self.latest: dict[str, str] = {} # Sid -> the query it typed last, older queries are skipped
+        self.lock = threading.Lock()
+        self.skipped = 0
+
+    @classmethod
+    def from_file_or_empty(cls, wikipedia_api: 'WikipediaAPI', path: str|None) -> 'Autocomplete':
+        if path is not None and os.path.exists(path):
+            return cls(wikipedia_api, TitleIndex.from_file(path))
+        return cls(wikipedia_api)
+
+    def lookup(self, query: str) -> list[dict]|None:
+        # None means the answer has to come from upstream, see submit
+        if query.strip() == "":
+            return []
+        suggestions = self.index.suggest(query, self.LIMIT)
+        if len(suggestions) > 0:
+            return suggestions
+        if len(query.strip()) < self.REMOTE_MIN_LENGTH:
+            return []
+        return self.remote.get(query.casefold())
+
+    def submit(self, sid: str, query: str, function, *args):
+        # Runs function(*args) on the autocomplete workers, unless the same client has typed something
+        # else by the time a worker gets to it
+        with self.lock:
+            self.latest[sid] = query
+
+        def run():
+            with self.lock:
+                if self.latest.get(sid) != query:
+                    self.skipped += 1
+                    return
+            function(*args)
+
+        self.workers.submit(run)
+
+    def forget(self, sid: str):
+        with self.lock:
+            self.latest.pop(sid, None)
+
+    def fetch(self, query: str) -> list[dict]:
+        suggestions = [{
+            "title": page["title"],
+            "key": page["key"],
+            "description": page.get("description") or ""
+        } for page in self.wikipedia_api.search_pages(query, self.LIMIT)]
+        self.remote.put(query.casefold(), suggestions, len(query) + sum(len(str(suggestion)) for suggestion in suggestions))
+        return suggestions
+
+def build_title_list(output: str, titles: list[str] = (), bundles: list[str] = (), popularity: list[str] = ()) -> int:
+    # Merges every source into the tab separated list TitleIndex.from_file reads, most popular first
+    entries: dict[str, int] = {}
+
+    for path in titles:
+        # A Wikimedia all-titles-in-ns0 dump or any other file with one title per line
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as titles_file:
+            for line in titles_file:
+                key = normalize_key(line.rstrip("\n"))
+                if key != "" and key != "page_title": # The dumps start with a header line
+                    entries.setdefault(key, 0)
+
+    for path in bundles:
+        from offlinewiki import BundleIndex, KIND_ARTICLE
+        bundle = BundleIndex(path)
+        for position in range(bundle.count):
+            if bundle.entry(position)[4] == KIND_ARTICLE:
+                entries.setdefault(bundle.key(position), 0)
+        bundle.close()
+
+    for path in popularity:
+        # Snapshots written by popularity.Popularity, decayed hit counts become the ranking
+        with open(path, "r", encoding="utf-8") as snapshot_file:
+            for key, score in json.load(snapshot_file)["scores"].items():
+                key = normalize_key(key)
+                entries[key] = entries.get(key, 0) + round(score * 100)
+
+    with open(output, "w", encoding="utf-8") as output_file:
+        for key, rank in sorted(entries.items(), key=lambda entry: -entry[1]):
+            output_file.write(key.replace("_", " ") + "\t" + str(rank) + "\n")
+    return len(entries)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the title list local autocomplete answers from")
+    parser.add_argument("output", help="Where to write the list, TITLE_LIST in .env")
+    parser.add_argument("--titles", action="append", default=[], help="File with one title per line, e.g. enwiki-latest-all-titles-in-ns0.gz")
+    parser.add_argument("--bundle", action="append", default=[], help="Offline bundle built by offlinewiki.py")
+    parser.add_argument("--popularity", action="append", default=[], help="Popularity snapshot, ranks titles by how often they're played")
+    args = parser.parse_args()
+    if len(args.titles) + len(args.bundle) + len(args.popularity) == 0:
+        parser.error("give at least one of --titles, --bundle or --popularity")
+    print("Wrote", build_title_list(args.output, args.titles, args.bundle, args.popularity), "titles to", args.output)
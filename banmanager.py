@@ -1,7 +1,173 @@
-banlist = []
+import os
+import logging
+import time
+import threading
+import ipaddress
 
-with open("banlist.txt", "r") as banlist_file:
-    banlist = banlist_file.readlines()
+BANLIST_PATH = "banlist.txt"
 
-def get_is_banned(ip):
-    return ip in banlist
\ No newline at end of file
+log = logging.getLogger(__name__)
+
+class PrefixTree:
+    # Binary trie over address bits, a node is [zero child, one child, banned]. A lookup walks at most
+    # 32 (or 128) bits no matter how many entries or ranges are banned.
+    def __init__(self):
+        self.roots = {4: [None, None, False], 6: [None, None, False]}
+        self.entries = 0
+
+    def add(self, network: ipaddress.IPv4Network|ipaddress.IPv6Network):
+        node = self.roots[network.version]
+        bits = int(network.network_address)
+        for position in range(network.max_prefixlen - 1, network.max_prefixlen - 1 - network.prefixlen, -1):
+            bit = (bits >> position) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, False]
+            node = node[bit]
+        node[2] = True
+        self.entries += 1
+
+    def contains(self, address: ipaddress.IPv4Address|ipaddress.IPv6Address) -> bool:
+        node = self.roots[address.version]
+        bits = int(address)
+        for position in range(address.max_prefixlen - 1, -1, -1):
+            if node[2]:
+                return True
+            node = node[(bits >> position) & 1]
+            if node is None:
+                return False
+        return node[2]
+
+class BanList:
+    RELOAD_INTERVAL = 2 # Seconds between checks of the file's modification time
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tree = PrefixTree()
+        self.mtime = None
+        self.checked_at = 0
+        self.lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        # One address or CIDR range per line, # starts a comment
+        try:
+            mtime = os.stat(self.path).st_mtime
+            with open(self.path, "r") as banlist_file:
+                lines = banlist_file.readlines()
+        except FileNotFoundError:
+            mtime, lines = None, []
+
+        tree = PrefixTree()
+        for line in lines:
+            entry = line.split("#")[0].strip()
+            if entry == "":
+                continue
+            try:
+                tree.add(ipaddress.ip_network(entry, strict=False))
+            except ValueError:
+                log.warning("ignoring invalid ban list entry=%r", entry)
+
+        self.tree = tree # Swapped in one go, lookups never see a half loaded list
+        self.mtime = mtime
+        log.info("loaded ban list entries=%d", tree.entries)
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if now - self.checked_at < self.RELOAD_INTERVAL:
+            return
+        with self.lock:
+            if now - self.checked_at < self.RELOAD_INTERVAL:
+                return
+            self.checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except FileNotFoundError:
+                mtime = None
+            if mtime != self.mtime:
+                self.reload()
+
+    def is_banned(self, ip: str) -> bool:
+        self._reload_if_changed()
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        return self.tree.contains(address)
+
+class RateLimiter:
+    # Token bucket per key: refills at rate tokens per second up to burst, each event takes one
+    PRUNE_INTERVAL = 60 # Seconds between sweeps of idle buckets
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.buckets: dict[str, list[float]] = {} # Key -> [tokens, last refill]
+        self.lock = threading.Lock()
+        self.pruned_at = time.monotonic()
+        self.limited = 0
+
+    def allow(self, key: str) -> bool:
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = [self.burst, now]
+                self.buckets[key] = bucket
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+
+            if now - self.pruned_at > self.PRUNE_INTERVAL:
+                self._prune(now)
+
+            if bucket[0] < 1:
+                self.limited += 1
+                return False
+            bucket[0] -= 1
+            return True
+
+    def _prune(self, now: float):
+        # A bucket that would have refilled completely carries no state worth keeping
+        refill = self.burst / self.rate
+        self.buckets = {key: bucket for key, bucket in self.buckets.items() if now - bucket[1] < refill}
+        self.pruned_at = now
+
+    def forget(self, key: str):
+        with self.lock:
+            self.buckets.pop(key, None)
+
+banlist = BanList(BANLIST_PATH)
+connection_limiter = RateLimiter(rate=1, burst=10) # New connections per IP
+ip_limiter = RateLimiter(rate=40, burst=80) # Socket events per IP, shared by every tab behind it
+sid_limiter = RateLimiter(rate=10, burst=30) # Socket events per connection
+page_limiter = RateLimiter(rate=10, burst=40) # Article requests per IP, these cost upstream budget
+
+MAX_STRIKES = 50 # Events dropped for one connection before it gets disconnected
+strikes: dict[str, int] = {}
+strikes_lock = threading.Lock()
+
+def get_is_banned(ip: str) -> bool:
+    return banlist.is_banned(ip)
+
+def allow_connection(ip: str) -> bool:
+    return connection_limiter.allow(ip)
+
+def allow_event(ip: str, sid: str) -> bool:
+    if sid_limiter.allow(sid) and ip_limiter.allow(ip):
+        return True
+    with strikes_lock:
+        strikes[sid] = strikes.get(sid, 0) + 1
+    return False
+
+def is_abusive(sid: str) -> bool:
+    return strikes.get(sid, 0) >= MAX_STRIKES
+
+def allow_page(ip: str) -> bool:
+    return page_limiter.allow(ip)
+
+def forget_sid(sid: str):
+    sid_limiter.forget(sid)
+    with strikes_lock:
+        strikes.pop(sid, None)
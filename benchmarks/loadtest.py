@@ -0,0 +1,344 @@
+# Drives N rooms of M bot players through the real socket handlers in main.py against the local stub
+# Wikipedia, then reports throughput, per-event latency percentiles and memory growth. Bots talk to
+# the app through Flask-SocketIO's test client, so this measures handlers, game state, the upstream
+# path and room fan-out, not the WebSocket transport itself.
+# Usage: python benchmarks/loadtest.py --rooms 20 --players 4 --rounds 3 [--compare latest]
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import resource
+import threading
+import subprocess
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(ROOT, "benchmarks", "results")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubwiki import StubWikipedia
+from htmltransform import transform
+
+START_TITLE = "Earth" # Every stub article is the Earth article, so its links are legal from anywhere
+POLL_INTERVAL = 0.0005
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    def record(self, event: str, seconds: float):
+        with self.lock:
+            self.latencies.setdefault(event, []).append(seconds)
+
+    def error(self, event: str):
+        with self.lock:
+            self.errors[event] = self.errors.get(event, 0) + 1
+
+    def summary(self) -> dict:
+        events = {}
+        for event in sorted(set(self.latencies) | set(self.errors)):
+            samples = sorted(self.latencies.get(event, []))
+            events[event] = {
+                "count": len(samples),
+                "errors": self.errors.get(event, 0),
+                "mean_ms": round(sum(samples) / len(samples) * 1000, 3) if samples else None,
+                "p50_ms": percentile(samples, 50),
+                "p90_ms": percentile(samples, 90),
+                "p99_ms": percentile(samples, 99),
+                "max_ms": round(samples[-1] * 1000, 3) if samples else None
+            }
+        return events
+
+def percentile(samples: list[float], percent: float) -> float|None:
+    if len(samples) == 0:
+        return None
+    position = min(len(samples) - 1, max(0, round(percent / 100 * len(samples) + 0.5) - 1)) # Nearest rank
+    return round(samples[position] * 1000, 3)
+
+class BotTimeout(Exception):
+    pass
+
+class Bot:
+    def __init__(self, main, address: str, recorder: Recorder, timeout: float):
+        flask_client = main.app.test_client()
+        flask_client.environ_base["REMOTE_ADDR"] = address
+        self.client = main.socketio.test_client(main.app, flask_test_client=flask_client)
+        self.recorder = recorder
+        self.timeout = timeout
+        self.inbox: list[tuple[str, dict]] = []
+        self.name = None
+
+    def _pump(self):
+        self.inbox.extend((message["name"], message["args"][0] if message["args"] else {}) for message in self.client.get_received())
+
+    def drain(self):
+        self._pump()
+        self.inbox.clear()
+
+    def wait_for(self, event: str, predicate = None) -> dict:
+        deadline = time.perf_counter() + self.timeout
+        while True:
+            self._pump()
+            for position, (name, data) in enumerate(self.inbox):
+                if name == event and (predicate is None or predicate(data)):
+                    del self.inbox[:position + 1] # Anything older is no longer interesting
+                    return data
+            if time.perf_counter() > deadline:
+                raise BotTimeout(event)
+            time.sleep(POLL_INTERVAL)
+
+    def request(self, label: str, event: str, data, expect: str, predicate = None) -> dict|None:
+        started = time.perf_counter()
+        if data is None:
+            self.client.emit(event)
+        else:
+            self.client.emit(event, data)
+        try:
+            response = self.wait_for(expect, predicate)
+        except BotTimeout:
+            self.recorder.error(label)
+            return None
+        if response.get("status") == "failure":
+            self.recorder.error(label)
+            return None
+        self.recorder.record(label, time.perf_counter() - started)
+        return response
+
+    def emit(self, event: str, data = None):
+        if data is None:
+            self.client.emit(event)
+        else:
+            self.client.emit(event, data)
+
+    def close(self):
+        if self.client.is_connected():
+            self.client.disconnect()
+
+def address(index: int) -> str:
+    # 198.18.0.0/15 is reserved for benchmarking, one address per bot keeps per-IP limits realistic
+    return f"198.{18 + index // 62500}.{index // 250 % 250}.{index % 250 + 1}"
+
+def changed(member: str):
+    return lambda data: member in data.get("changes", {})
+
+def run_room(main, index: int, args, links: list[str], recorder: Recorder, failures: list):
+    generator = random.Random(index)
+    bots = [Bot(main, address(index * args.players + seat), recorder, args.timeout) for seat in range(args.players)]
+    think = lambda: time.sleep(args.think * (0.5 + generator.random()))
+    try:
+        for bot in bots:
+            bot.emit("client_connect")
+
+        room = f"bench{index:05d}"
+        host = bots[0]
+        for bot in bots:
+            event = "try_create_room" if bot is host else "try_join_room"
+            snapshot = bot.request(event, event, {"room": room, "code": "1234"}, "join_room")
+            if snapshot is None:
+                raise BotTimeout(event)
+            bot.name = snapshot["username"]
+            think()
+
+        end_key = generator.choice(links)
+        clickable = [link for link in links if link != end_key]
+        host.drain()
+        host.request("search_pages", "search_pages", {"query": START_TITLE, "element": "start_article"}, "room_update", changed("start_article"))
+        host.request("search_pages", "search_pages", {"query": end_key.replace("_", " "), "element": "end_article"}, "room_update", changed("end_article"))
+
+        for bot in bots:
+            text = f"good luck from {bot.name}"
+            bot.request("send_chat_message", "send_chat_message", {"text": text}, "send_chat_message", lambda data: data.get("message") == text)
+            think()
+
+        for race in range(args.rounds):
+            for bot in bots:
+                bot.drain()
+            host.request("try_start_game", "try_start_game", None, "start")
+            for bot in bots[1:]:
+                bot.wait_for("start")
+
+            for click in range(args.clicks):
+                for bot in bots:
+                    bot.request("navpage", "game_mode_event", {"event": "navpage", "page_id": generator.choice(clickable)}, "navpage")
+                    think()
+                if click == args.clicks // 2:
+                    for bot in bots:
+                        bot.request("navpage_back", "game_mode_event", {"event": "navpage", "direction": "back"}, "navpage")
+                        think()
+
+            winner = bots[race % len(bots)]
+            winner.request("victory", "game_mode_event", {"event": "navpage", "page_id": end_key}, "victory_race")
+            for bot in bots:
+                if bot is not winner:
+                    bot.wait_for("victory_race")
+
+            for bot in bots:
+                bot.emit("return_to_room_settings")
+                think()
+            host.wait_for("room_update", lambda data: data.get("changes", {}).get("state") == "IN_ROOM_SETTINGS")
+    except BotTimeout as timeout:
+        failures.append(f"{room if 'room' in locals() else index}: timed out waiting for {timeout}")
+    finally:
+        for bot in bots:
+            bot.close()
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def git_commit() -> str|None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args) -> dict:
+    stub = StubWikipedia(latency=args.upstream_latency).start()
+    scratch = tempfile.mkdtemp(prefix="wikispeedrun-loadtest-") # Everything the app would persist goes here
+
+    # The app reads these at import, the stub stands in for Wikimedia and the budget is lifted so the
+    # benchmark measures this server rather than the production rate limit
+    os.environ.update({
+        "WIKI_BACKEND": "online",
+        "STATE_BACKEND": "memory",
+        "ASYNC_MODE": "threading",
+        "MESSAGE_QUEUE": "",
+        "UPSTREAM_RPS": str(args.upstream_rps),
+        "UPSTREAM_BURST": str(args.upstream_rps),
+        "MAX_CONNECTIONS": str(args.rooms * args.players + 100),
+        "LOG_LEVEL": "WARNING",
+        "GAME_HISTORY": os.path.join(scratch, "games.sqlite3"), # Bot games shouldn't land in the real history
+        "POPULARITY_SNAPSHOT": os.path.join(scratch, "popularity.json"),
+        "STATE_SNAPSHOT": os.path.join(scratch, "state.json.gz") # Nor bot rooms get restored by the next real boot
+    })
+    os.chdir(ROOT)
+    import main
+    from pagecache import PageMetaCache
+    main.wikipedia.BASE_URL = stub.base_url
+    main.wikipedia.page_cache = PageMetaCache(store_path=None) # Don't read or pollute the real page store
+
+    links = [link for link in transform(stub.page_html.decode("utf-8"))[1] if ":" not in link] # Links players can see
+    recorder = Recorder()
+    failures: list[str] = []
+
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=run_room, args=(main, index, args, links, recorder, failures), name=f"room-{index}") for index in range(args.rooms)]
+    for thread in threads:
+        thread.start()
+        time.sleep(args.ramp / max(1, args.rooms))
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+    rss_after = rss_bytes()
+
+    events = recorder.summary()
+    total = sum(event["count"] for event in events.values())
+    stub.stop()
+    main.wikipedia.transformer.close()
+    main.game_history.close()
+    shutil.rmtree(scratch, ignore_errors=True)
+    return {
+        "commit": git_commit(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {key: getattr(args, key) for key in ("rooms", "players", "rounds", "clicks", "think", "upstream_latency", "upstream_rps")},
+        "duration_s": round(duration, 3),
+        "throughput_eps": round(total / duration, 1),
+        "events": events,
+        "failures": failures,
+        "memory": {
+            "rss_before_mb": round(rss_before / 1024 / 1024, 1),
+            "rss_after_mb": round(rss_after / 1024 / 1024, 1),
+            "rss_growth_mb": round((rss_after - rss_before) / 1024 / 1024, 1),
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        },
+        "upstream_requests": stub.requests
+    }
+
+def report(result: dict):
+    config = result["config"]
+    print(f"{config['rooms']} rooms x {config['players']} players, {config['rounds']} rounds of {config['clicks']} clicks, commit {result['commit']}")
+    print(f"{result['duration_s']}s, {result['throughput_eps']} events/s, {result['upstream_requests']} upstream requests")
+    print(f"{'event':<20}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, event in result["events"].items():
+        print(f"{name:<20}{event['count']:>8}{event['errors']:>8}{event['p50_ms'] or '-':>10}{event['p90_ms'] or '-':>10}{event['p99_ms'] or '-':>10}{event['max_ms'] or '-':>10}")
+    memory = result["memory"]
+    print(f"rss {memory['rss_before_mb']} -> {memory['rss_after_mb']} MiB (+{memory['rss_growth_mb']}), peak {memory['peak_rss_mb']} MiB")
+    for failure in result["failures"]:
+        print("failed:", failure)
+
+def save(result: dict, label: str = None) -> str:
+    os.makedirs(RESULTS, exist_ok=True)
+    name = datetime.now().strftime("%Y%m%d-%H%M%S") + (f"-{label}" if label else "") + ".json"
+    path = os.path.join(RESULTS, name)
+    with open(path, "w") as result_file:
+        json.dump(result, result_file, indent=2)
+    return path
+
+def latest(config: dict, exclude: str = None) -> str|None:
+    # Most recent saved run with the same shape, only those are comparable
+    if not os.path.isdir(RESULTS):
+        return None
+    for name in sorted(os.listdir(RESULTS), reverse=True):
+        path = os.path.join(RESULTS, name)
+        if path == exclude or not name.endswith(".json"):
+            continue
+        with open(path) as result_file:
+            if json.load(result_file).get("config") == config:
+                return path
+    return None
+
+def compare(result: dict, path: str):
+    with open(path) as baseline_file:
+        baseline = json.load(baseline_file)
+    print(f"\ncompared to {os.path.basename(path)} (commit {baseline.get('commit')})")
+
+    def delta(new, old) -> str:
+        if new is None or old is None or old == 0:
+            return "-"
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    print(f"{'throughput':<20}{delta(result['throughput_eps'], baseline['throughput_eps']):>10}")
+    print(f"{'rss growth':<20}{delta(result['memory']['rss_growth_mb'], baseline['memory']['rss_growth_mb']):>10}")
+    print(f"{'event':<20}{'p50':>10}{'p99':>10}")
+    for name, event in result["events"].items():
+        old = baseline["events"].get(name, {})
+        print(f"{name:<20}{delta(event['p50_ms'], old.get('p50_ms')):>10}{delta(event['p99_ms'], old.get('p99_ms')):>10}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the game server with simulated rooms against a stub Wikipedia")
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--players", type=int, default=4, help="Bots per room")
+    parser.add_argument("--rounds", type=int, default=3, help="Races each room plays")
+    parser.add_argument("--clicks", type=int, default=6, help="Links each bot follows per race before someone wins")
+    parser.add_argument("--think", type=float, default=0.05, help="Average seconds a bot waits between actions")
+    parser.add_argument("--ramp", type=float, default=1.0, help="Seconds over which rooms are started")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Seconds to wait for any single response")
+    parser.add_argument("--upstream-latency", type=float, default=0.0, help="Seconds the stub Wikipedia takes per request")
+    parser.add_argument("--upstream-rps", type=float, default=100000, help="Upstream budget given to the scheduler")
+    parser.add_argument("--label", help="Appended to the saved result's file name")
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--compare", help="Saved result to compare against, or 'latest' for the last run with the same config")
+    args = parser.parse_args()
+
+    result = run(args)
+    report(result)
+
+    saved = None
+    if not args.no_save:
+        saved = save(result, args.label)
+        print("saved", os.path.relpath(saved, ROOT))
+    if args.compare:
+        baseline = latest(result["config"], exclude=saved) if args.compare == "latest" else args.compare
+        if baseline is None:
+            print("\nno earlier run with the same config to compare against")
+        else:
+            compare(result, baseline)
+    os._exit(1 if result["failures"] else 0) # Skip waiting on the app's background threads
@@ -0,0 +1,122 @@
+# Memory used by players and rooms mid-race, comparing the old dict based model with the current one.
+# Usage: python benchmarks/memory.py [players]
+import os
+import sys
+import gc
+import random
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gamemanager import Player, Room, RoomState
+from wiki import PageMeta
+
+PLAYERS = 100_000
+PLAYERS_PER_ROOM = 4
+PATH_LENGTH = 12 # Pages visited per player so far
+VOCABULARY = 50_000 # Distinct articles being raced through
+
+# The model as it was before pages were interned: plain attributes and a dict per visited page
+class LegacyPageMeta:
+    def __init__(self, title, page_id):
+        self.title = title
+        self.page_id = page_id
+
+    def serialize(self):
+        return {"title": self.title, "page_id": self.page_id}
+
+class LegacyPlayer:
+    def __init__(self, session_id: str):
+        self.sid = session_id
+        self.name = session_id
+        self.room = None
+        self.page_path = []
+        self.ready = True
+        self.current_page_index = -1
+        self.navigation_id = 0
+
+class LegacyRoom:
+    def __init__(self, name: str, code: str):
+        self.name = name
+        self.requires_code = True
+        self.code = code
+        self.players = []
+        self.owner = None
+        self.start_article = None
+        self.end_article = None
+        self.waiting_for_reset = True
+        self.state = RoomState.PLAYING
+        self.version = 0
+        self.broadcast_state = {}
+
+def vocabulary() -> list[tuple[str, str]]:
+    pages = []
+    for number in range(VOCABULARY):
+        title = "Article number " + str(number)
+        pages.append((title, title.replace(" ", "_")))
+    return pages
+
+def routes(players: int) -> list[list[int]]:
+    generator = random.Random(0)
+    return [[generator.randrange(VOCABULARY) for _ in range(PATH_LENGTH)] for _ in range(players)]
+
+def build_legacy(players: int, pages: list[tuple[str, str]], paths: list[list[int]]) -> list:
+    rooms = []
+    for number in range(0, players, PLAYERS_PER_ROOM):
+        room = LegacyRoom("room" + str(number), "1234")
+        room.start_article = LegacyPageMeta(*pages[paths[number][0]])
+        room.end_article = LegacyPageMeta(*pages[paths[number][-1]])
+        for sid in range(number, min(number + PLAYERS_PER_ROOM, players)):
+            player = LegacyPlayer("sid" + str(sid))
+            player.room = room
+            player.page_path = [room.start_article.serialize()]
+            for page in paths[sid][1:]:
+                title, key = pages[page]
+                player.page_path.append({"title": title, "page_id": "".join(key)}) # Keys arrived fresh from each client event
+            player.current_page_index = len(player.page_path) - 1
+            room.players.append(player)
+        room.owner = room.players[0]
+        rooms.append(room)
+    return rooms
+
+def build_current(players: int, pages: list[tuple[str, str]], paths: list[list[int]]) -> list:
+    rooms = []
+    for number in range(0, players, PLAYERS_PER_ROOM):
+        room = Room("room" + str(number), "1234", None)
+        room.state = RoomState.PLAYING
+        room.settings.start_article = PageMeta(*pages[paths[number][0]])
+        room.settings.end_article = PageMeta(*pages[paths[number][-1]])
+        for sid in range(number, min(number + PLAYERS_PER_ROOM, players)):
+            player = Player("sid" + str(sid))
+            player.room = room
+            player.history.visit(room.settings.start_article.id)
+            for page in paths[sid][1:]:
+                title, key = pages[page]
+                player.visit("".join(key), title)
+            room.players.append(player)
+        room.owner = room.players[0]
+        rooms.append(room)
+    return rooms
+
+def measure(build, players: int, pages: list[tuple[str, str]], paths: list[list[int]]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    rooms = build(players, pages, paths)
+    gc.collect()
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del rooms
+    return used
+
+if __name__ == "__main__":
+    players = int(sys.argv[1]) if len(sys.argv) > 1 else PLAYERS
+    pages = vocabulary()
+    paths = routes(players)
+
+    legacy = measure(build_legacy, players, pages, paths)
+    current = measure(build_current, players, pages, paths) # Includes the page table itself
+
+    print(f"{players} players, {PATH_LENGTH} pages each, {VOCABULARY} distinct pages")
+    print(f"legacy:  {legacy / 1024 / 1024:8.1f} MiB  {legacy / players:7.0f} B/player")
+    print(f"current: {current / 1024 / 1024:8.1f} MiB  {current / players:7.0f} B/player")
+    print(f"saved:   {(1 - current / legacy) * 100:7.1f}%")
@@ -0,0 +1,94 @@
+# Local stand-in for the Wikimedia core REST API, serving the fixtures checked in at the repo root.
+# Every article is out.html (the Earth article) so every link on it is a legal move, and searches
+# answer with result.json behind a hit for the query itself.
+# Usage: python benchmarks/stubwiki.py [port]
+import os
+import sys
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, unquote, parse_qs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_PREFIX = "/core/v1/wikipedia/en"
+
+def load_fixtures() -> tuple[bytes, list[dict]]:
+    with open(os.path.join(ROOT, "out.html"), "r", encoding="utf-16") as html_file: # Saved from a browser as UTF-16
+        page_html = html_file.read().encode("utf-8")
+    with open(os.path.join(ROOT, "result.json"), "r", encoding="utf-8") as search_file:
+        search_results = json.load(search_file)
+    return page_html, search_results
+
+class StubWikipedia:
+    def __init__(self, port: int = 0, latency: float = 0):
+        self.page_html, self.search_results = load_fixtures()
+        self.latency = latency # Seconds added to every response to mimic the real upstream
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self.thread: threading.Thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/core/v1/wikipedia/"
+
+    def start(self) -> 'StubWikipedia':
+        self.thread = threading.Thread(target=self.server.serve_forever, name="stub-wikipedia", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def search(self, query: str, limit: int) -> list[dict]:
+        key = query.strip().replace(" ", "_")
+        hit = {"id": 0, "key": key, "title": query.strip(), "description": "Stub article"}
+        return ([hit] + [page for page in self.search_results if page["key"] != key])[:limit]
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send(self, status: int, body: bytes, content_type: str):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                with stub.lock:
+                    stub.requests += 1
+                if stub.latency > 0:
+                    time.sleep(stub.latency)
+
+                url = urlparse(self.path)
+                path = url.path[len(API_PREFIX):] if url.path.startswith(API_PREFIX) else url.path
+                if path == "/search/page":
+                    query = parse_qs(url.query)
+                    pages = stub.search(query.get("q", [""])[0], int(query.get("limit", ["1"])[0]))
+                    return self.send(200, json.dumps({"pages": pages}).encode("utf-8"), "application/json")
+
+                parts = path.split("/") # ["", "page", title, "bare"|"html"]
+                if len(parts) != 4 or parts[1] != "page":
+                    return self.send(404, json.dumps({"httpCode": 404}).encode("utf-8"), "application/json")
+                key = unquote(parts[2])
+                if parts[3] == "bare":
+                    page = {"id": 0, "key": key, "title": key.replace("_", " ")}
+                    return self.send(200, json.dumps(page).encode("utf-8"), "application/json")
+                return self.send(200, stub.page_html, "text/html; charset=utf-8")
+
+        return Handler
+
+if __name__ == "__main__":
+    stub = StubWikipedia(int(sys.argv[1]) if len(sys.argv) > 1 else 8901)
+    print("Serving stub Wikipedia at", stub.base_url)
+    stub.server.serve_forever()
@@ -0,0 +1,38 @@
+import threading
+
+class ConnectionGate:
+    # Caps the Socket.IO sessions one worker holds. Once it is full (or draining for shutdown) new
+    # connections are refused and clients back off and retry, rather than slowing down everyone connected.
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self.lock = threading.Lock()
+        self.open = 0
+        self.draining = False
+        self.refused = 0
+
+    def try_open(self) -> bool:
+        with self.lock:
+            if self.draining or self.open >= self.max_connections:
+                self.refused += 1
+                return False
+            self.open += 1
+            return True
+
+    def close(self):
+        with self.lock:
+            self.open = max(0, self.open - 1)
+
+    def drain(self):
+        with self.lock:
+            self.draining = True
+
+    def open_count(self) -> int:
+        return self.open
+
+    def stats(self) -> dict:
+        return {
+            "open": self.open,
+            "max": self.max_connections,
+            "refused": self.refused,
+            "draining": self.draining
+        }
@@ -2,11 +2,14 @@ from enum import Enum
 
 class EventType(Enum):
 
+    CONNECT = "connect"
     CLIENT_CONNECT = "client_connect"
     CLIENT_DISCONNECT = "disconnect"
+    SESSION = "session"
 
     TRY_JOIN_ROOM = "try_join_room"
     TRY_CREATE_ROOM = "try_create_room"
+    TRY_SPECTATE_ROOM = "try_spectate_room"
     TRY_LEAVE_ROOM = "try_leave_room"
     RETURN_TO_ROOM_SETTINGS = "return_to_room_settings"
     TRY_CHANGE_USERNAME = "try_change_username"
@@ -20,12 +23,16 @@ class EventType(Enum):
     SEND_CHAT_MESSAGE = "send_chat_message"
 
     ROOM_UPDATE = "room_update"
+    RESYNC_ROOM = "resync_room"
 
     SEARCH_PAGES = "search_pages"
+    RANDOM_PAIR = "random_pair"
+    AUTOCOMPLETE = "autocomplete"
 
     TRY_START_GAME = "try_start_game"
     START_GAME_RESPONSE = "start_game_response"
 
     GAME_MODE_EVENT = "game_mode_event"
+    RACE_PROGRESS = "race_progress"
 
     FORCE_DISCONNECT = "force_disconnect"
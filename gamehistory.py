@@ -0,0 +1,205 @@
+import os
+import time
+import queue
+import sqlite3
+import logging
+import threading
+import metrics
+
+log = logging.getLogger(__name__)
+
+PATH_SEPARATOR = "|" # Never valid in a Wikipedia title
+
+class RunRecord:
+    __slots__ = ("player", "path", "clicks", "duration", "won")
+
+    def __init__(self, player: str, path: list[str], duration: float|None, won: bool):
+        self.player = player
+        self.path = path # Titles from the start article to where the player ended up
+        self.clicks = len(path) - 1
+        self.duration = duration # Seconds from the start to the finish, None if they didn't finish
+        self.won = won
+
+class GameRecord:
+    __slots__ = ("room", "start_key", "end_key", "started_at", "finished_at", "runs")
+
+    def __init__(self, room: str, start_key: str, end_key: str, started_at: float, finished_at: float, runs: list[RunRecord]):
+        self.room = room
+        self.start_key = start_key
+        self.end_key = end_key
+        self.started_at = started_at
+        self.finished_at = finished_at
+        self.runs = runs
+
+class GameHistory:
+    # Finished games go into an append-only SQLite store. Recording only queues the game, a writer thread
+    # commits whatever has piled up in one transaction so the socket handler that ended the race never
+    # touches the disk. Per pair totals are kept alongside so popular pairs don't scan every game.
+    STORE_PATH = "cache/games.sqlite3"
+    BATCH_SIZE = 200 # Games per transaction at most
+    FLUSH_INTERVAL = 1.0 # Seconds a game can sit in the queue before it's written
+    MAX_LIMIT = 100 # Rows any one query returns
+
+    def __init__(self, path: str = STORE_PATH):
+        directory = os.path.dirname(path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS games (
+                id INTEGER PRIMARY KEY,
+                room TEXT NOT NULL,
+                start_key TEXT NOT NULL,
+                end_key TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                finished_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS runs (
+                game_id INTEGER NOT NULL,
+                player TEXT NOT NULL,
+                start_key TEXT NOT NULL,
+                end_key TEXT NOT NULL,
+                won INTEGER NOT NULL,
+                clicks INTEGER NOT NULL,
+                duration REAL,
+                finished_at REAL NOT NULL,
+                path TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pairs (
+                start_key TEXT NOT NULL,
+                end_key TEXT NOT NULL,
+                plays INTEGER NOT NULL,
+                best_duration REAL,
+                last_played REAL NOT NULL,
+                PRIMARY KEY (start_key, end_key)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS runs_leaderboard ON runs (start_key, end_key, won, duration);
+            CREATE INDEX IF NOT EXISTS runs_player ON runs (player, finished_at);
+            CREATE INDEX IF NOT EXISTS pairs_plays ON pairs (plays);
+        """)
+
+        self.queue: queue.Queue[GameRecord|None] = queue.Queue()
+        self.written = 0
+        self.thread = threading.Thread(target=self._write_loop, name="game-history", daemon=True)
+        self.thread.start()
+
+    def record(self, game: GameRecord):
+        self.queue.put(game)
+
+    def pending(self) -> int:
+        return self.queue.qsize()
+
+    def _write_loop(self):
+        while True:
+            game = self.queue.get()
+            if game is None:
+                return
+            batch = [game]
+            deadline = time.monotonic() + self.FLUSH_INTERVAL
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    game = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if game is None:
+                    self._write(batch)
+                    return
+                batch.append(game)
+            self._write(batch)
+
+    def _write(self, batch: list[GameRecord]):
+        started = time.perf_counter()
+        try:
+            with self.lock:
+                self.connection.execute("BEGIN")
+                try:
+                    for game in batch:
+                        self._insert(game)
+                    self.connection.execute("COMMIT")
+                except Exception:
+                    self.connection.execute("ROLLBACK")
+                    raise
+            self.written += len(batch)
+        except Exception:
+            log.exception("writing game history failed games=%d", len(batch))
+        metrics.task_seconds.observe(time.perf_counter() - started, task="write_game_history")
+
+    def _insert(self, game: GameRecord):
+        game_id = self.connection.execute(
+            "INSERT INTO games (room, start_key, end_key, started_at, finished_at) VALUES (?, ?, ?, ?, ?)",
+            (game.room, game.start_key, game.end_key, game.started_at, game.finished_at)
+        ).lastrowid
+        self.connection.executemany(
+            "INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(game_id, run.player, game.start_key, game.end_key, int(run.won), run.clicks, run.duration, game.finished_at, PATH_SEPARATOR.join(run.path)) for run in game.runs]
+        )
+        best = min((run.duration for run in game.runs if run.won and run.duration is not None), default=None)
+        self.connection.execute("""
+            INSERT INTO pairs VALUES (?, ?, 1, ?, ?)
+            ON CONFLICT (start_key, end_key) DO UPDATE SET
+                plays = plays + 1,
+                best_duration = min(coalesce(best_duration, excluded.best_duration), coalesce(excluded.best_duration, best_duration)),
+                last_played = excluded.last_played
+        """, (game.start_key, game.end_key, best, game.finished_at))
+
+    def _query(self, sql: str, args: tuple) -> list:
+        with self.lock:
+            return self.connection.execute(sql, args).fetchall()
+
+    def _limit(self, limit: int) -> int:
+        return max(1, min(limit, self.MAX_LIMIT))
+
+    def leaderboard(self, start_key: str, end_key: str, limit: int = 10) -> list[dict]:
+        # Fastest winning runs for one pair, straight off the runs_leaderboard index
+        rows = self._query("""
+            SELECT player, duration, clicks, finished_at, path FROM runs
+            WHERE start_key = ? AND end_key = ? AND won = 1 AND duration IS NOT NULL
+            ORDER BY duration LIMIT ?
+        """, (start_key, end_key, self._limit(limit)))
+        return [{
+            "player": player,
+            "duration": duration,
+            "clicks": clicks,
+            "finished_at": finished_at,
+            "path": path.split(PATH_SEPARATOR)
+        } for player, duration, clicks, finished_at, path in rows]
+
+    def popular_pairs(self, limit: int = 10) -> list[dict]:
+        rows = self._query("SELECT start_key, end_key, plays, best_duration, last_played FROM pairs ORDER BY plays DESC LIMIT ?", (self._limit(limit),))
+        return [{
+            "start": start_key,
+            "end": end_key,
+            "plays": plays,
+            "best_duration": best_duration,
+            "last_played": last_played
+        } for start_key, end_key, plays, best_duration, last_played in rows]
+
+    def player_games(self, player: str, limit: int = 10) -> list[dict]:
+        # Players have no accounts, so this is everyone who has played under that name
+        rows = self._query("""
+            SELECT runs.game_id, games.room, runs.start_key, runs.end_key, runs.won, runs.clicks, runs.duration, runs.finished_at, runs.path
+            FROM runs JOIN games ON games.id = runs.game_id
+            WHERE runs.player = ? ORDER BY runs.finished_at DESC LIMIT ?
+        """, (player, self._limit(limit)))
+        return [{
+            "game": game_id,
+            "room": room,
+            "start": start_key,
+            "end": end_key,
+            "won": bool(won),
+            "clicks": clicks,
+            "duration": duration,
+            "finished_at": finished_at,
+            "path": path.split(PATH_SEPARATOR)
+        } for game_id, room, start_key, end_key, won, clicks, duration, finished_at, path in rows]
+
+    def close(self):
+        # Writes out everything still queued before the connection goes away
+        self.queue.put(None)
+        self.thread.join()
+        with self.lock:
+            self.connection.close()
+        log.info("closed game history written=%d", self.written)
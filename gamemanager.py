@@ -2,11 +2,25 @@ from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from responsegen import ResponseGenerator
 import utils
+import time
+import hmac
+import secrets
+import logging
+import threading
+import metrics
 from flask_socketio import join_room, leave_room
 from enum import Enum
 from wiki import PageMeta, NoPage
+from pagetable import pages
+from history import NavigationHistory
+from scheduler import Priority, prioritized
+
+log = logging.getLogger(__name__)
 from abc import ABC, abstractmethod
 from wiki import WikipediaAPI
+from pairgen import PairPool, Difficulty
+from statebackend import StateBackend, InMemoryStateBackend
+from gamehistory import GameHistory, GameRecord, RunRecord
 
 # Errors
 class GameManagerError(Exception): 
@@ -26,8 +40,14 @@ class RoomAuthenticationErrorException(GameManagerError): client_error = "The co
 class PlayerNotInRoomException(GameManagerError): client_error = "Player not found in this room"
 class NotRoomOwnerException(GameManagerError): client_error = "Not the owner of the room"
 class RoomNotInWaitingRoomException(GameManagerError): client_error = "That room is already in a game"
+class SpectatorException(GameManagerError): client_error = "Spectators can't play in this race"
+class AlreadyInRoomException(GameManagerError): client_error = "Leave your current room first"
+class SessionExpiredException(GameManagerError): client_error = "That session has expired"
+class RoomBusyException(GameManagerError): client_error = "That room is busy, try again"
 
 class PageNotFoundException(GameManagerError): client_error = "Couldn't find that page"
+class NoRandomPairException(GameManagerError): client_error = "No random articles are ready at that difficulty yet"
+class IllegalMoveException(GameManagerError): client_error = "That page isn't linked from the current page"
 
 class MalformedRequestException(GameManagerError): client_error = "Malformed request"
 
@@ -36,19 +56,79 @@ class InvalidInputException(GameManagerError):
         self.client_error = input_validation_result.value
         self.error_context = error_context
 
+TOKEN_SEPARATOR = ":" # Never part of a Socket.IO sid
+
 # Player class
 class Player:
+    __slots__ = ("sid", "name", "room", "history", "ready", "navigation_id", "spectating", "clicks", "moved_at", "token", "detached_at")
+
     def __init__(self, session_id: str):
         self.sid: str = session_id # Session ID provided by 
         self.name: str = session_id # Unique username
         self.room: Room = None # Tracks joined room, should be updated by Room.add_player
-        self.page_path: list[dict] = [] # Tracks navigated pages, should be updated by GameModeResponse and reset by Room
+        self.history = NavigationHistory() # Tree of navigated pages (for back & forward), should be updated by GameModeResponse and reset by Room
         self.ready = True # Is player ready to start a game?
 
-        self.current_page_index = -1 # The index of the page in the page_path that the player is viewing (for back & forward history)
+        self.navigation_id = 0 # Bumped on every navigation so stale lookups can be dropped
+        self.spectating = False # Watching the room's races instead of playing in them, set by Room.add_spectator
+
+        self.clicks = 0 # Navigations this race, back and forward included, reset at the start of every race
+        self.moved_at: float = None # Server time of the latest navigation
+
+        self.token = secrets.token_urlsafe(16) # Secret half of the resume token, proves a new socket is this player
+        self.detached_at: float = None # Server time the player lost their socket, None while connected
+
+    def resume_token(self) -> str:
+        # Carries the sid so resuming is a single lookup, changes whenever the sid does
+        return self.sid + TOKEN_SEPARATOR + self.token
+
+    def record_move(self):
+        self.clicks += 1
+        self.moved_at = time.time()
+
+    def visit(self, key: str, title: str = None):
+        self.history.visit(pages.intern(key, title))
+
+    def get_page_path(self) -> list[str]:
+        return [pages.key(page_id) for page_id in self.history.path()]
 
     def get_title_page_path(self) -> list[str]:
-        return [page["title"] for page in self.page_path]
+        return [pages.title(page_id) for page_id in self.history.path()]
+
+    def get_current_title(self) -> str:
+        page_id = self.history.current_page()
+        return pages.title(page_id) if page_id is not None else ""
+
+    def get_abandoned_branches(self) -> list[list[str]]:
+        return [[pages.title(page_id) for page_id in branch] for branch in self.history.abandoned()]
+
+    def to_record(self) -> dict:
+        return {
+            "sid": self.sid,
+            "name": self.name,
+            "room": self.room.name if self.room is not None else None,
+            "history": self.history.to_record(),
+            "ready": self.ready,
+            "navigation_id": self.navigation_id,
+            "spectating": self.spectating,
+            "clicks": self.clicks,
+            "moved_at": self.moved_at,
+            "token": self.token,
+            "detached_at": self.detached_at
+        }
+
+    def load_record(self, record: dict):
+        # Room membership is restored by the state backend, which owns the Room objects
+        self.name = record["name"]
+        self.history = NavigationHistory.from_record(record["history"])
+        self.ready = record["ready"]
+        self.navigation_id = record["navigation_id"]
+        self.spectating = record["spectating"]
+        self.clicks = record["clicks"]
+        self.moved_at = record["moved_at"]
+        self.token = record["token"]
+        self.detached_at = record["detached_at"]
+
 # Game modes
 class GameModeResponse(Enum):
     START = "start"
@@ -65,59 +145,119 @@ class GameModeResponse(Enum):
             return response_gen.emit(GameModeResponse.CHANGE_ALL_SCENES, response_gen.change_scene, player.room.name, room=player.room, **data)
         elif self == GameModeResponse.NAV_PAGE:
 
-            if player.current_page_index == -1:
-                player.current_page_index = 0
-
-            success = True
-
             if "direction" in data.keys():
-                print(data)
-                print(player.current_page_index)
-                print(player.page_path)
-                player.current_page_index += -1 if data["direction"] == "back" else 1
-
-                if player.current_page_index >= len(player.page_path):
-                    player.current_page_index = len(player.page_path) - 1
-                
-                print(player.current_page_index)
-                if player.current_page_index > 0:
-                    data["page_id"] = player.page_path[player.current_page_index]["page_id"]
-                else:
-                    data["page_id"] = player.room.settings.start_article.page_id
-                
-                
-            else:
-                player.page_path = player.page_path[0:player.current_page_index+1]
-                success = wikipedia_api.process_page_request(data["page_id"], player, True)
-                player.current_page_index = len(player.page_path) - 1
-                
-            if success:
-                print(room.state)
                 response_gen.eval_correct_state(room, RoomState.PLAYING)
-                print(room.state)
+                player.navigation_id += 1 # A click still being looked up no longer applies
+                if data["direction"] == "back":
+                    player.history.back()
+                else:
+                    player.history.forward()
+
+                data["page_id"] = player.history.current_key() or player.room.settings.start_article.page_id
+                player.record_move()
+                response_gen.emit_progress(room.name)
+                wikipedia_api.prefetcher.follow(room.name, player.sid, data["page_id"])
                 return response_gen.emit(GameModeResponse.NAV_PAGE, response_gen.nav_page, player.sid, page_id = data["page_id"])
             else:
-                return response_gen.emit_error_response(GameModeResponse.NAV_PAGE, PageNotFoundException)
+                response_gen.eval_correct_state(room, RoomState.PLAYING)
+                player.navigation_id += 1
+                return wikipedia_api.submit(run_task, navigate, response_gen, room, wikipedia_api, player, data["page_id"], player.navigation_id)
         elif self == GameModeResponse.VICTORY_RACE:
             response_gen.eval_correct_state(room, RoomState.PLAYING)
-            room.unready_all_players()
-            room.state = RoomState.WAITING
-            response_gen.emit_room_update(room.name)
-            return response_gen.emit(GameModeResponse.VICTORY_RACE, response_gen.change_scene, player.room.name, room=player.room, scene="victory", winner_name=player.name, page_path=player.get_title_page_path())
+            player.navigation_id += 1
+            return wikipedia_api.submit(run_task, finish_race, response_gen, room, wikipedia_api, player, data["page_id"], player.navigation_id)
         elif self == GameModeResponse.NONE:
             return
         elif self == GameModeResponse.START:
             start_article = player.room.settings.start_article
             for other_player in player.room.players:
-                other_player.page_path = [start_article.serialize()]
-                other_player.current_page_index = 0
+                other_player.history = NavigationHistory(start_article.id)
+                other_player.clicks = 0
+                other_player.moved_at = None
+                wikipedia_api.prefetcher.follow(room.name, other_player.sid, start_article.page_id)
             response_gen.eval_correct_state(room, RoomState.IN_ROOM_SETTINGS)
             player.room.state = RoomState.PLAYING
-            response_gen.emit_room_update(player.room.name)
-            print(player.room.state)
+            player.room.started_at = time.time()
+            response_gen.emit_progress(player.room.name)
+            response_gen.emit_room_update(player.room.name, immediate=True)
             return response_gen.emit(GameModeResponse.START, response_gen.start, player.room.name, scene="wikiWindow", start_title = room.settings.start_article.page_id)
         else:
-            print(f"Unhandled GameModeResponse: {self.value}")
+            log.warning("unhandled game mode response=%s", self.value)
+
+# Navigation lookups run on the WikipediaAPI worker pool so a slow upstream never blocks a socket handler
+def run_task(task, *args):
+    with metrics.task_seconds.time(task=task.__name__):
+        task(*args)
+
+def validate_navigation(wikipedia_api: WikipediaAPI, player: Player, page_id: str):
+    current_page = player.history.current_key()
+    with prioritized(Priority.NAVIGATION):
+        if not wikipedia_api.is_valid_move(current_page, page_id):
+            raise IllegalMoveException("Navigating page")
+        record = wikipedia_api.get_page_object(page_id)
+    if record.missing:
+        raise PageNotFoundException("Navigating page")
+    return record
+
+def navigate(response_gen: 'ResponseGenerator', room: 'Room', wikipedia_api: WikipediaAPI, player: Player, page_id: str, navigation_id: int):
+    try:
+        record = validate_navigation(wikipedia_api, player, page_id)
+        with response_gen.gamemanager.session():
+            player = response_gen.gamemanager.get_player(player.sid) # Reload, another worker may have changed it meanwhile
+            room = player.room
+            if room is None or navigation_id != player.navigation_id or not room.is_playing():
+                return # Player moved on (or the race ended) while we were looking the page up
+
+            player.visit(page_id, record.title)
+            player.record_move()
+        response_gen.emit_progress(room.name)
+        wikipedia_api.prefetcher.follow(room.name, player.sid, page_id)
+        response_gen.emit(GameModeResponse.NAV_PAGE, response_gen.nav_page, player.sid, page_id = page_id)
+    except GameManagerError as e:
+        response_gen.emit_error_response(GameModeResponse.NAV_PAGE, e, player.sid)
+    except Exception as e:
+        log.exception("navigation failed sid=%s page=%s", player.sid, page_id)
+        response_gen.emit_error_response(GameModeResponse.NAV_PAGE, PageNotFoundException("Navigating page"), player.sid)
+
+def finish_race(response_gen: 'ResponseGenerator', room: 'Room', wikipedia_api: WikipediaAPI, player: Player, page_id: str, navigation_id: int):
+    try:
+        validate_navigation(wikipedia_api, player, page_id)
+        with response_gen.gamemanager.session():
+            player = response_gen.gamemanager.get_player(player.sid)
+            room = player.room
+            if room is None:
+                return
+            with room.lock:
+                if navigation_id != player.navigation_id or not room.is_playing():
+                    return # Someone else got there first
+                room.unready_all_players()
+                room.state = RoomState.WAITING
+            response_gen.emit_room_update(room.name, immediate=True)
+            response_gen.gamemanager.record_game(room, player)
+
+        route = player.get_page_path() + [page_id]
+        optimal = wikipedia_api.solver.solve(route[0], page_id)
+        if optimal is None or len(optimal) > len(route):
+            optimal = route # The graph only knows pages someone has loaded, the winner's route is still an upper bound
+
+        response_gen.emit(
+            GameModeResponse.VICTORY_RACE,
+            response_gen.change_scene,
+            room.name,
+            room=room,
+            scene="victory",
+            winner_name=player.name,
+            page_path=player.get_title_page_path(),
+            abandoned_branches=player.get_abandoned_branches(),
+            clicks=len(route) - 1,
+            optimal_path=[wikipedia_api.title_of(key) for key in optimal],
+            degrees=len(optimal) - 1
+        )
+    except GameManagerError as e:
+        response_gen.emit_error_response(GameModeResponse.NAV_PAGE, e, player.sid)
+    except Exception as e:
+        log.exception("finishing race failed sid=%s page=%s", player.sid, page_id)
+        response_gen.emit_error_response(GameModeResponse.NAV_PAGE, PageNotFoundException("Finishing race"), player.sid)
 
 class GameMode(ABC):
     name = "Base GameMode"
@@ -153,12 +293,13 @@ GAME_MODES = {
 
 # Room setting container
 class RoomSettings:
-    mode: GameMode
-    start_article: PageMeta = None
-    end_article: PageMeta = None
+    __slots__ = ("mode", "start_article", "end_article", "api")
 
     def __init__(self, room, api: WikipediaAPI):
-        self.mode = GAME_MODES["Race"](room)
+        self.mode: GameMode = GAME_MODES["Race"](room)
+        self.start_article: PageMeta = None
+        self.end_article: PageMeta = None
+        self.api = api
 
     def get_member_or(self, member, default = NoPage()):
         value = getattr(self, member)
@@ -168,6 +309,28 @@ class RoomSettings:
     def set_member(self, member, value):
         setattr(self, member, value)
 
+    def randomize_articles(self, pair_pool: PairPool, difficulty: Difficulty):
+        pair = pair_pool.pick(difficulty)
+        if pair is None:
+            raise NoRandomPairException("Randomizing articles")
+        start, end = pair
+        self.start_article = PageMeta(self.api.title_of(start), start)
+        self.end_article = PageMeta(self.api.title_of(end), end)
+
+    def to_record(self) -> dict:
+        return {
+            "mode": self.mode.name,
+            "start_article": self.start_article.serialize() if self.start_article is not None else None,
+            "end_article": self.end_article.serialize() if self.end_article is not None else None
+        }
+
+    def load_record(self, room, record: dict):
+        if record["mode"] != self.mode.name:
+            self.mode = GAME_MODES[record["mode"]](room)
+        for member in ("start_article", "end_article"):
+            article = record[member]
+            self.set_member(member, PageMeta(article["title"], article["page_id"]) if article is not None else None)
+
     def check_room_settings_complete(self) -> bool:
         if type(self.mode) is not GameMode:
             return False
@@ -186,25 +349,70 @@ class RoomState(Enum):
     WAITING = "WAITING"
 
 class Room:
+    __slots__ = ("name", "requires_code", "code", "players", "spectators", "owner", "settings", "waiting_for_reset", "state", "started_at", "lock", "version", "broadcast_state")
+
     def __init__(self, name: str, code: str, api: WikipediaAPI):
         self.name = name # Room name
         self.requires_code = True # Require a code by default
         self.code = code if not code == "" else utils.generate_pin() # Generate four digit code for room if no code provided
         self.players: list[Player] = [] # Tracks players, should be updated by Room.add_player
+        self.spectators: list[Player] = [] # Watching without playing, should be updated by Room.add_spectator
         self.owner = None # Room creator
         self.settings = RoomSettings(self, api)
         self.waiting_for_reset = True # If we're waiting for all players to press finish
         self.state = RoomState.IN_ROOM_SETTINGS # What we're doing right now
+        self.started_at: float = None # Server time the current (or last) race started
+        self.lock = threading.Lock() # Guards state changes made from navigation workers
+        self.version = 0 # Bumped on every broadcast room update
+        self.broadcast_state: dict = {} # Room info as of the last broadcast, room updates only send what changed
+
+    def to_record(self) -> dict:
+        return {
+            "name": self.name,
+            "code": self.code,
+            "requires_code": self.requires_code,
+            "players": [player.sid for player in self.players],
+            "spectators": [spectator.sid for spectator in self.spectators],
+            "owner": self.owner.sid if self.owner is not None else None,
+            "settings": self.settings.to_record(),
+            "waiting_for_reset": self.waiting_for_reset,
+            "state": self.state.value,
+            "started_at": self.started_at,
+            "version": self.version,
+            "broadcast_state": self.broadcast_state
+        }
+
+    def load_record(self, record: dict, players: dict[str, Player]):
+        self.code = record["code"]
+        self.requires_code = record["requires_code"]
+        self.players = [players[sid] for sid in record["players"] if sid in players]
+        self.spectators = [players[sid] for sid in record["spectators"] if sid in players]
+        self.owner = players.get(record["owner"])
+        self.settings.load_record(self, record["settings"])
+        self.waiting_for_reset = record["waiting_for_reset"]
+        self.state = RoomState(record["state"])
+        self.started_at = record["started_at"]
+        self.version = record["version"]
+        self.broadcast_state = record["broadcast_state"]
 
     def add_player(self, player: Player):
         if self.owner == None:
             self.owner = player
         if player.sid == player.name:
-            player.name = utils.generate_unique_name(self.players)
+            player.name = utils.generate_unique_name(self.players + self.spectators)
         self.players.append(player)
         player.room = self
         join_room(self.name, player.sid)
 
+    def add_spectator(self, player: Player):
+        # Spectators share the room's broadcasts (updates, progress, chat, victory) but never race
+        if player.sid == player.name:
+            player.name = utils.generate_unique_name(self.players + self.spectators)
+        self.spectators.append(player)
+        player.room = self
+        player.spectating = True
+        join_room(self.name, player.sid)
+
     def can_player_join(self) -> bool:
         return self.state == RoomState.IN_ROOM_SETTINGS
     def is_playing(self) -> bool:
@@ -216,22 +424,28 @@ class Room:
     def evaluate_waiting_for_reset(self) -> bool:
         for player in self.players:
             if not player.ready:
-                print("Waiting for reset.")
                 self.waiting_for_reset = True
                 return True
-        print("All players were ready.")
         self.waiting_for_reset = False
         return False
     
+    def update_state(self) -> bool:
+        waiting = self.evaluate_waiting_for_reset()
+        if self.state == RoomState.WAITING and not waiting:
+            self.state = RoomState.IN_ROOM_SETTINGS
+        return waiting
+
     def unready_all_players(self):
         for player in self.players:
             player.ready = False
     
     def remove_player(self, player: Player):
+        if player.spectating:
+            return self.remove_spectator(player)
         try:
             assign_new_leader = self.owner.sid == player.sid
             self.players.remove(player)
-            leave_room(self.name, player.sid)
+            leave_room(self.name, player.sid, namespace="/") # Also called outside of any socket event
             player.room = None
             if assign_new_leader:
                 if len(self.players) > 0:
@@ -241,56 +455,169 @@ class Room:
             raise PlayerNotInRoomException("Removing player from room")
         return len(self.players) == 0
 
+    def remove_spectator(self, player: Player):
+        try:
+            self.spectators.remove(player)
+        except ValueError:
+            raise PlayerNotInRoomException("Removing spectator from room")
+        leave_room(self.name, player.sid, namespace="/")
+        player.room = None
+        player.spectating = False
+        return len(self.players) == 0
+
 # Game manager
 class GameManager:
-    def __init__(self):
-        self.players: dict[str, Player] = {}
-        self.rooms = {}
+    RECONNECT_GRACE = 30 # Seconds a disconnected player keeps their seat, 0 removes them straight away
+
+    def __init__(self, state: StateBackend = None, history: GameHistory = None, reconnect_grace: float = RECONNECT_GRACE):
+        self.state = state if state is not None else InMemoryStateBackend()
+        self.history = history # Finished games are only kept when there's somewhere to keep them
+        self.reconnect_grace = reconnect_grace
+
+    def session(self):
+        return self.state.session()
 
     def get_username_taken(self, room: Room, username: str):
-        for player in room.players:
+        for player in room.players + room.spectators:
             if player.name == username:
                 return True
             
         return False
 
     def create_player(self, sid: str):
-        self.players[sid] = Player(sid)
+        self.state.save_player(Player(sid))
+        metrics.sessions.inc(result="new")
         return self.get_player(sid)
     
-    def remove_player(self, sid: str) -> str|None:
+    def remove_player(self, sid: str) -> tuple[str|None, list[str]]:
+        # Returns the room that still needs an update (None if it's gone) and the spectators it sent home
         player = self.get_player(sid)
-        if player.room is not None:
-            room = player.room.name
-            room_empty = player.room.remove_player(player)
-            if room_empty:
-                self.destroy_room(room)
-            else:
-                return room
-        try:
-            
-            del self.players[sid]
-        except KeyError:
+        room, evicted = self.leave_room(player) if player.room is not None else (None, [])
+        if not self.state.delete_player(sid):
             raise PlayerDoesNotExistException("Removing player")
+        return room, evicted
+
+    def leave_room(self, player: Player) -> tuple[str|None, list[str]]:
+        # Same return as remove_player, once the last racer is gone the room goes with them
+        room_object = player.room
+        if room_object is None:
+            raise PlayerNotInRoomException("Leaving room")
+        room = room_object.name
+        evicted = []
+        if room_object.remove_player(player):
+            evicted = [spectator.sid for spectator in list(room_object.spectators)]
+            for spectator in list(room_object.spectators):
+                room_object.remove_spectator(spectator)
+            self.destroy_room(room)
+            room = None
+        return room, evicted
+
+    def disconnect_player(self, sid: str) -> tuple[str|None, list[str]]:
+        # Players in a room are held for the grace period so a dropped connection doesn't cost them their
+        # seat, the room stays exactly as it was and nobody is sent an update. Anyone else goes right away.
+        player = self.state.fetch_player(sid)
+        if player is None:
+            return None, [] # Already resumed on another socket
+        if player.room is None or self.reconnect_grace <= 0:
+            return self.remove_player(sid)
+        self.detach_player(sid, self.reconnect_grace)
+        metrics.sessions.inc(result="detached")
+        return None, []
+
+    def detach_player(self, sid: str, grace: float):
+        # Keeps the player and their room as they are until the grace period runs out or they resume
+        player = self.get_player(sid)
+        player.detached_at = time.time()
+        self.state.hold_player(sid, player.detached_at + grace)
+
+    def resume_player(self, token: str, sid: str) -> tuple[Player, str|None]:
+        # Moves a player over to a new socket, the room never notices they were gone. Also returns the old
+        # sid if that socket is still open, a client usually reconnects before the server notices it left.
+        old_sid, _, secret = token.rpartition(TOKEN_SEPARATOR)
+        player = self.state.fetch_player(old_sid) if old_sid != "" else None
+        if player is None or not hmac.compare_digest(player.token, secret):
+            raise SessionExpiredException("Resuming session")
+
+        replaced = old_sid if player.detached_at is None else None
+        self.state.release_player(old_sid)
+        self.state.delete_player(old_sid)
+        player.sid = sid
+        player.token = secrets.token_urlsafe(16)
+        player.detached_at = None
+        self.state.save_player(player)
+
+        room = player.room
+        if room is not None:
+            join_room(room.name, sid)
+            if room.state == RoomState.WAITING:
+                player.ready = True # They come back to the room settings, not the victory screen
+            self.state.save_room(room) # Members are stored by sid
+        metrics.sessions.inc(result="resumed")
+        return player, replaced
+
+    def expire_detached(self) -> list[tuple[str|None, list[str]]]:
+        # Removes everyone whose grace period ran out, with what remove_player returned for each
+        removed = []
+        for sid in self.state.claim_expired_players(time.time()):
+            try:
+                removed.append(self.remove_player(sid))
+                metrics.sessions.inc(result="expired")
+            except GameManagerError:
+                pass # Already gone
+        return removed
 
     def get_player(self, sid: str) -> Player:
-        try:
-            return self.players[sid]
-        except KeyError:
+        player = self.state.fetch_player(sid)
+        if player is None:
             raise PlayerDoesNotExistException("Retrieving player")
+        return player
         
     def get_room(self, room: str) -> Room:
-        try:
-            return self.rooms[room]
-        except KeyError:
+        room_object = self.state.fetch_room(room)
+        if room_object is None:
             raise RoomDoesNotExistException("Retrieving room")
+        return room_object
     
     def destroy_room(self, room: str):
-        try:
-            del self.rooms[room]
-        except KeyError:
+        if not self.state.delete_room(room):
             raise RoomDoesNotExistException("Destroying room")
 
+    def record_game(self, room: Room, winner: Player):
+        # Snapshot of how everyone did, taken before anyone heads back to the room settings
+        if self.history is None:
+            return
+        finished_at = time.time()
+        end_article = room.settings.end_article
+        runs = []
+        for player in room.players:
+            path = player.get_title_page_path()
+            if player is winner:
+                path.append(end_article.title)
+            runs.append(RunRecord(player.name, path, finished_at - room.started_at if player is winner else None, player is winner))
+        self.history.record(GameRecord(room.name, room.settings.start_article.page_id, end_article.page_id, room.started_at, finished_at, runs))
+
+    def room_names(self) -> list[str]:
+        return self.state.room_names()
+
+    def detached_count(self) -> int:
+        return self.state.held_count()
+
+    def player_count(self) -> int:
+        return self.state.player_count()
+
+    def sweep_pages(self) -> int:
+        # Frees page table IDs no player path or room setting refers to any more
+        live = set()
+        players, rooms = self.state.resident()
+        for room in rooms:
+            players.extend(room.players + room.spectators)
+            for article in (room.settings.start_article, room.settings.end_article):
+                if article is not None:
+                    live.add(article.id)
+        for player in players:
+            live.update(player.history.pages)
+        return pages.sweep(live)
+
 
     def change_username(self, room: Room, player: Player, username: str):
         if self.get_username_taken(room, username):
@@ -304,14 +631,16 @@ class GameManager:
 
         self._validate(name)
 
-        if name in self.rooms.keys():
+        if not self.state.claim_room(name):
             raise RoomExistsException()
         
-        self.rooms[name] = Room(name, code, api)
+        self.state.save_room(Room(name, code, api))
         return self.get_room(name)
     
     def join_room(self, player: Player, room: Room, code: str = "", ignore_incorrect: bool = False):
 
+        self.validate_not_in_room(player)
+
         if (room.requires_code and not room.code == code) and not ignore_incorrect:
             raise RoomAuthenticationErrorException()
         
@@ -319,6 +648,24 @@ class GameManager:
             raise RoomNotInWaitingRoomException()
         
         room.add_player(player)
+
+    def spectate_room(self, player: Player, room: Room, code: str = ""):
+        # Unlike joining, spectating works mid race
+        self.validate_not_in_room(player)
+        if room.requires_code and not room.code == code:
+            raise RoomAuthenticationErrorException()
+
+        room.add_spectator(player)
+
+    def validate_not_in_room(self, player: Player):
+        if player.room is not None:
+            raise AlreadyInRoomException("Entering room")
+
+    def validate_racing(self, player: Player):
+        if player.room is None:
+            raise PlayerNotInRoomException("Racing")
+        if player.spectating:
+            raise SpectatorException("Racing")
     
     def validate_owns_room(self, player: Player):
         if not player.room.owner == player:
@@ -0,0 +1,95 @@
+from array import array
+from pagetable import pages
+
+class NavigationHistory:
+    # Every page a player opens becomes a node whose parent is the page they clicked from, so going back
+    # and then clicking somewhere new starts a branch instead of throwing the old forward pages away.
+    # Back, forward and visit only move the cursor or append a node, nothing is ever copied.
+    __slots__ = ("pages", "parents", "forwards", "current")
+
+    def __init__(self, start: int = None):
+        self.pages = array("I") # Page table ID of each node
+        self.parents = array("i") # Node we came from, -1 for the start page
+        self.forwards = array("i") # Child that forward returns to, the branch visited most recently
+        self.current = -1
+        if start is not None:
+            self.visit(start)
+
+    def visit(self, page_id: int):
+        self.pages.append(page_id)
+        self.parents.append(self.current)
+        self.forwards.append(-1)
+        node = len(self.pages) - 1
+        if self.current != -1:
+            self.forwards[self.current] = node
+        self.current = node
+
+    def back(self) -> bool:
+        if self.current == -1 or self.parents[self.current] == -1:
+            return False
+        self.current = self.parents[self.current]
+        return True
+
+    def forward(self) -> bool:
+        if self.current == -1 or self.forwards[self.current] == -1:
+            return False
+        self.current = self.forwards[self.current]
+        return True
+
+    def current_page(self) -> int|None:
+        if self.current == -1:
+            return None
+        return self.pages[self.current]
+
+    def current_key(self) -> str|None:
+        page_id = self.current_page()
+        return pages.key(page_id) if page_id is not None else None
+
+    def _line(self, node: int) -> list[int]:
+        line = []
+        while node != -1:
+            line.append(node)
+            node = self.parents[node]
+        line.reverse()
+        return line
+
+    def path(self) -> list[int]:
+        # Pages from the start to the one being viewed, as page table IDs
+        return [self.pages[node] for node in self._line(self.current)]
+
+    def abandoned(self) -> list[list[int]]:
+        # Each dead end off the current line, from the page it forked at to where the player turned back
+        line = set(self._line(self.current))
+        has_children = set(self.parents)
+        branches = []
+        for node in range(len(self.pages)):
+            if node in line or node in has_children:
+                continue
+            branch = []
+            while node not in line:
+                branch.append(self.pages[node])
+                node = self.parents[node]
+            branch.append(self.pages[node])
+            branch.reverse()
+            branches.append(branch)
+        return branches
+
+    def to_record(self) -> dict:
+        return {
+            "pages": [[pages.key(page_id), pages.title(page_id)] for page_id in self.pages],
+            "parents": list(self.parents),
+            "forwards": list(self.forwards),
+            "current": self.current
+        }
+
+    @classmethod
+    def from_record(cls, record: dict) -> 'NavigationHistory':
+        history = cls()
+        history.pages = array("I", [pages.intern(key, title) for key, title in record["pages"]])
+        history.parents = array("i", record["parents"])
+        history.forwards = array("i", record["forwards"])
+        history.current = record["current"]
+        return history
+
+    def __len__(self):
+        return len(self.pages)
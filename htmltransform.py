@@ -0,0 +1,184 @@
+import re
+import time
+import html
+import logging
+import metrics
+from html.parser import HTMLParser
+from concurrent.futures import ProcessPoolExecutor
+from linkindex import article_link
+
+log = logging.getLogger(__name__)
+
+ARTICLE_URL = "https://en.wikipedia.org/wiki/"
+SITE_URL = "https://en.wikipedia.org"
+
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+PREFORMATTED = {"pre", "textarea"}
+DROPPED_ELEMENTS = {"script", "style", "base", "noscript"}
+# Whole subtrees the game never shows: citation markers and lists, navboxes and hidden descriptions
+DROPPED_CLASSES = {"mw-ref", "mw-references-wrap", "mw-references", "reflist", "navbox", "navbox-styles", "shortdescription"}
+DROPPED_ATTRIBUTES = {"about", "typeof", "data-parsoid", "resource", "prefix"}
+URL_ATTRIBUTES = {"href", "src", "resource"}
+PARSOID_ID = re.compile(r"mw[\w-]{1,6}$") # Generated per element, real anchors like headings keep theirs
+
+class LeanTransformer(HTMLParser):
+    # One pass over Parsoid HTML that drops metadata and irrelevant subtrees, makes relative URLs
+    # absolute and collects the article links left in what the player actually sees
+    def __init__(self):
+        super().__init__(convert_charrefs=False) # Entities are passed through untouched
+        self.out: list[str] = []
+        self.links: list[str] = []
+        self.seen: set[str] = set()
+        self.skip_depth = 0
+        self.preformatted = 0
+
+    def _dropped(self, tag: str, attrs: list) -> bool:
+        if tag in DROPPED_ELEMENTS:
+            return True
+        for name, value in attrs:
+            if name == "class" and value is not None and not DROPPED_CLASSES.isdisjoint(value.split()):
+                return True
+            if name == "typeof" and value is not None and "mw:Extension/references" in value:
+                return True
+        if tag == "meta":
+            return not any(name == "charset" for name, _ in attrs)
+        if tag == "link":
+            return not any(name == "rel" and value == "stylesheet" for name, value in attrs)
+        return False
+
+    def _url(self, value: str) -> str:
+        if value.startswith("./"):
+            return ARTICLE_URL + value[2:]
+        if value.startswith("/w/"):
+            return SITE_URL + value
+        return value
+
+    def _tag(self, tag: str, attrs: list, closing: str) -> str:
+        parts = ["<", tag]
+        for name, value in attrs:
+            if name in DROPPED_ATTRIBUTES or name.startswith("data-mw"):
+                continue
+            if value is None:
+                parts.append(" " + name)
+                continue
+            if name == "id" and PARSOID_ID.match(value):
+                continue
+            if name == "rel":
+                value = " ".join(token for token in value.split() if not token.startswith("mw:"))
+                if value == "":
+                    continue
+            if name in URL_ATTRIBUTES:
+                if tag == "a" and name == "href" and value.startswith("./"):
+                    self._collect(value[2:])
+                value = self._url(value)
+            parts.append(f' {name}="{html.escape(value)}"')
+        parts.append(closing)
+        return "".join(parts)
+
+    def _collect(self, target: str):
+        key = article_link(target)
+        if key is not None and key not in self.seen:
+            self.seen.add(key)
+            self.links.append(key)
+
+    def handle_starttag(self, tag, attrs):
+        if self.skip_depth > 0:
+            if tag not in VOID_ELEMENTS:
+                self.skip_depth += 1
+            return
+        if self._dropped(tag, attrs):
+            if tag not in VOID_ELEMENTS:
+                self.skip_depth = 1
+            return
+        if tag in PREFORMATTED:
+            self.preformatted += 1
+        self.out.append(self._tag(tag, attrs, ">"))
+
+    def handle_startendtag(self, tag, attrs):
+        if self.skip_depth > 0 or self._dropped(tag, attrs):
+            return
+        self.out.append(self._tag(tag, attrs, "/>"))
+
+    def handle_endtag(self, tag):
+        if self.skip_depth > 0:
+            if tag not in VOID_ELEMENTS:
+                self.skip_depth -= 1
+            return
+        if tag in PREFORMATTED and self.preformatted > 0:
+            self.preformatted -= 1
+        self.out.append(f"</{tag}>")
+
+    def handle_data(self, data):
+        if self.skip_depth > 0:
+            return
+        if self.preformatted == 0 and data.isspace():
+            data = "\n" if "\n" in data else " " # Indentation between tags renders the same as one space
+        self.out.append(data)
+
+    def handle_entityref(self, name):
+        if self.skip_depth == 0:
+            self.out.append(f"&{name};")
+
+    def handle_charref(self, name):
+        if self.skip_depth == 0:
+            self.out.append(f"&#{name};")
+
+    def handle_decl(self, decl):
+        self.out.append(f"<!{decl}>")
+
+    def handle_comment(self, data):
+        pass
+
+    def result(self) -> str:
+        return "".join(self.out)
+
+def transform(page_html: str) -> tuple[str, list[str]]:
+    transformer = LeanTransformer()
+    transformer.feed(page_html)
+    transformer.close()
+    return transformer.result(), transformer.links
+
+class HTMLTransformer:
+    WORKERS = 2 # Processes parsing pages so a big article never holds the GIL of the server process
+
+    def __init__(self, workers: int = WORKERS):
+        self.workers = workers
+        self.pool = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+        self.bytes_in = 0 # Totals over every transformed page, exported on /metrics
+        self.bytes_out = 0
+        if self.pool is not None:
+            # Fork every worker now while the process is still single threaded, forking later could
+            # copy a lock some other thread happens to hold
+            self.pool.submit(transform, "").result()
+
+    def transform(self, key: str, page_html: str) -> tuple[str, list[str]]:
+        started = time.perf_counter()
+        if self.pool is not None:
+            lean_html, links = self.pool.submit(transform, page_html).result()
+        else:
+            lean_html, links = transform(page_html)
+        metrics.task_seconds.observe(time.perf_counter() - started, task="transform_html")
+
+        before, after = len(page_html.encode("utf-8")), len(lean_html.encode("utf-8"))
+        self.bytes_in += before
+        self.bytes_out += after
+        metrics.html_reduction.observe(1 - after / before if before > 0 else 0)
+        log.debug("transformed page key=%s bytes=%d->%d (-%.0f%%)", key, before, after, (1 - after / before) * 100 if before > 0 else 0)
+        return lean_html, links
+
+    def stats(self) -> dict:
+        return {"upstream": self.bytes_in, "delivered": self.bytes_out}
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+if __name__ == "__main__":
+    # python htmltransform.py page.html [encoding], prints the size reduction and link count
+    import sys
+    with open(sys.argv[1], "r", encoding=sys.argv[2] if len(sys.argv) > 2 else "utf-8") as page_file:
+        page_html = page_file.read()
+    started = time.perf_counter()
+    lean_html, links = transform(page_html)
+    before, after = len(page_html.encode("utf-8")), len(lean_html.encode("utf-8"))
+    print(f"{before} -> {after} bytes (-{(1 - after / before) * 100:.1f}%), {len(links)} links, {(time.perf_counter() - started) * 1000:.0f} ms")
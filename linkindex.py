@@ -0,0 +1,168 @@
+import time
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from urllib.parse import unquote
+from concurrent.futures import Executor
+from pagetable import PageTable
+
+log = logging.getLogger(__name__)
+
+# Namespaces the client refuses to navigate to (see disallowedModifiers in wikispeedrun.js)
+DISALLOWED_NAMESPACES = {
+    "User", "Wikipedia", "WP", "Project", "File", "MediaWiki", "Template", "Help", "Draft",
+    "TimedText", "Module", "MOS", "Topic", "Education Program", "Book", "Gadget", "Gadget definition"
+}
+
+def link_key(key: str) -> str:
+    key = key.strip().replace(" ", "_")
+    return key[:1].upper() + key[1:]
+
+def article_link(target: str) -> str|None:
+    # Key of a relative link target (without the leading ./), None if it isn't a navigable article
+    target = unquote(target)
+    if "#" in target or "?" in target:
+        return None # Fragments, red links and other non-article actions
+    if ":" in target and target.split(":")[0] in DISALLOWED_NAMESPACES:
+        return None
+    return link_key(target)
+
+def run_in(pool: Executor|None, function, *args):
+    # Pure Python loops over every edge go to a worker process so they never hold this process's GIL
+    if pool is None:
+        return function(*args)
+    return pool.submit(function, *args).result()
+
+def pack(pages: list[tuple[int, array]]) -> tuple[array, array, array]:
+    # Page IDs, link counts and every page's links end to end, cheap to send to a worker process
+    sources = array("I", [source for source, _ in pages])
+    lengths = array("I", [len(targets) for _, targets in pages])
+    flat = array("I")
+    for _, targets in pages:
+        flat.extend(targets)
+    return sources, lengths, flat
+
+def unpack(sources: array, lengths: array, flat: array) -> dict[int, array]:
+    links = {}
+    position = 0
+    for source, length in zip(sources, lengths):
+        links[source] = flat[position:position + length]
+        position += length
+    return links
+
+def renumber(sources: array, flat: array) -> tuple[array, array, array]:
+    # Gives the IDs still in use consecutive numbers. The old order is kept so link arrays stay sorted.
+    used = sorted(set(sources).union(flat))
+    mapping = dict(zip(used, range(len(used))))
+    return array("I", used), array("I", map(mapping.__getitem__, sources)), array("I", map(mapping.__getitem__, flat))
+
+class LinkView:
+    # A page table and the links numbered by it, swapped as one so readers never mix IDs from two tables
+    __slots__ = ("table", "links")
+
+    def __init__(self, table: PageTable, links: dict[int, array]):
+        self.table = table
+        self.links = links # Page ID -> sorted array of linked page IDs, oldest page first
+
+class LinkIndex:
+    # Links of recently rendered pages. The index numbers pages with its own table, so every link target
+    # of every page doesn't end up in the process-wide one. When either limit is reached the oldest pages
+    # are dropped and the table is rebuilt with only the keys still referenced.
+    MAX_PAGES = 20_000
+    MAX_KEYS = 2_000_000
+    KEEP_PAGES = 10_000 # Newest pages kept by a compaction
+
+    def __init__(self, table: PageTable = None, pool: Executor = None):
+        self.view = LinkView(table if table is not None else PageTable(), {})
+        self.pool = pool
+        self.lock = threading.Lock() # Serializes writers, readers go through whatever view is current
+        self.compacting = False
+        self.changed: set[str] = set() # Keys written while a compaction runs, carried over to the new view
+        self.compactions = 0
+
+    @property
+    def table(self) -> PageTable:
+        return self.view.table
+
+    @property
+    def links(self) -> dict[int, array]:
+        return self.view.links
+
+    def add_links(self, key: str, links: list[str]):
+        key = link_key(key)
+        with self.lock:
+            view = self.view
+            targets = array("I", sorted(set(view.table.intern(link) for link in links)))
+            source = view.table.intern(key)
+            view.links.pop(source, None) # Re-adding makes it the newest page
+            view.links[source] = targets
+            self._written(key, view)
+
+    def add_alias(self, alias: str, key: str):
+        alias = link_key(alias)
+        with self.lock:
+            view = self.view
+            targets = view.links.get(view.table.lookup(link_key(key)))
+            if targets is not None:
+                view.links[view.table.intern(alias)] = targets
+                self._written(alias, view)
+
+    def _written(self, key: str, view: LinkView):
+        # Caller holds the lock
+        if self.compacting:
+            self.changed.add(key)
+        elif len(view.links) > self.MAX_PAGES or len(view.table) > self.MAX_KEYS:
+            self.compacting = True
+            threading.Thread(target=self._compact, name="link-index", daemon=True).start()
+
+    def _compact(self):
+        started = time.perf_counter()
+        try:
+            with self.lock:
+                view = self.view
+                kept = list(view.links.items())[-self.KEEP_PAGES:]
+                self.changed = set()
+
+            sources, lengths, flat = pack(kept)
+            used, sources, flat = run_in(self.pool, renumber, sources, flat)
+            table = PageTable.from_keys(list(map(view.table.keys.__getitem__, used)))
+            links = unpack(sources, lengths, flat)
+
+            with self.lock:
+                # Pages written meanwhile went into the old view, they're few so they're just copied over
+                for key in self.changed:
+                    targets = view.links.get(view.table.lookup(key))
+                    if targets is not None:
+                        source = table.intern(key)
+                        links.pop(source, None)
+                        links[source] = array("I", sorted(table.intern(view.table.key(target)) for target in targets))
+                self.view = LinkView(table, links)
+                self.compactions += 1
+            log.info("compacted link index pages=%d->%d keys=%d->%d ms=%.0f", len(view.links), len(links), len(view.table), len(table), (time.perf_counter() - started) * 1000)
+        except Exception:
+            log.exception("link index compaction failed")
+        finally:
+            with self.lock:
+                self.compacting = False
+                self.changed = set()
+
+    def has_page(self, key: str) -> bool:
+        view = self.view
+        return view.table.lookup(link_key(key)) in view.links
+
+    def has_link(self, key: str, target: str) -> bool:
+        view = self.view
+        targets = view.links.get(view.table.lookup(link_key(key)))
+        target_id = view.table.lookup(link_key(target))
+        if targets is None or target_id is None:
+            return False
+        position = bisect_left(targets, target_id)
+        return position < len(targets) and targets[position] == target_id
+
+    def stats(self) -> dict:
+        view = self.view
+        return {"pages": len(view.links), "keys": len(view.table)}
+
+    def __len__(self):
+        return len(self.view.links)
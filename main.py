@@ -1,28 +1,131 @@
-from flask import Flask, render_template, request, send_file
-from flask_socketio import SocketIO
+from flask import Flask, Response, render_template, request, send_file
+from werkzeug.middleware.proxy_fix import ProxyFix
+from urllib.parse import quote
+from flask_socketio import SocketIO, disconnect
 import dotenv
+import logging
+import requests
+import metrics
 from os import getenv
-from gamemanager import GameManager, GameManagerError, MalformedRequestException, PageNotFoundException
+from functools import wraps
+from statebackend import InMemoryStateBackend, RedisStateBackend
+from gamehistory import GameHistory
+from snapshot import StateSnapshot
+from gamemanager import GameManager, GameManagerError, MalformedRequestException, PageNotFoundException, PlayerNotInRoomException
 from responsegen import ResponseGenerator
 from eventtype import EventType as E
-from waitress import serve
+from connectiongate import ConnectionGate
 from wiki import WikipediaAPI
+from htmltransform import HTMLTransformer
+from scheduler import RequestScheduler, Priority, StaleRequestError, prioritized
+from offlinewiki import OfflineWikipediaAPI
+from pairgen import PairPool, Difficulty
+from autocomplete import Autocomplete
+from popularity import Popularity
+from wiki import PageMeta
+from linkindex import link_key
+from pagetable import pages
 import banmanager
 
 dotenv.load_dotenv()
 
+logging.basicConfig(level=getenv("LOG_LEVEL", "INFO").upper(), format="%(asctime)s %(levelname)s %(name)s %(message)s")
+log = logging.getLogger("main")
+
 app = Flask(__name__)
 app.config["SECRET_KEY"] = getenv("SECRET_KEY", "secret")
 app.config["TEMPLATES_AUTO_RELOAD"] = getenv("TEMPLATE_AUTO_RELOAD", False)
-socketio = SocketIO(app)
+# With several workers, broadcasts go through a shared message queue so every worker reaches its own sockets
+socketio = SocketIO(app, async_mode=getenv("ASYNC_MODE") or None, message_queue=getenv("MESSAGE_QUEUE") or None)
+# Behind a load balancer every client arrives from its address, so rate limits and bans key on the client
+# X-Forwarded-For names instead. Wrapped around Socket.IO so the handshake sees the client address too.
+trusted_proxies = int(getenv("TRUSTED_PROXIES", 0)) # Proxies in front of us, only that many forwarded hops are believed
+if trusted_proxies > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=trusted_proxies, x_proto=trusted_proxies)
+connection_gate = ConnectionGate(int(getenv("MAX_CONNECTIONS", 5000)))
 
-game_manager = GameManager()
+if getenv("WIKI_BACKEND", "online") == "offline":
+    wikipedia = OfflineWikipediaAPI(getenv("WIKI_BUNDLE", "bundle"))
+else:
+    wikipedia = WikipediaAPI(
+        scheduler=RequestScheduler(float(getenv("UPSTREAM_RPS", 10)), float(getenv("UPSTREAM_BURST", 20))),
+        transformer=HTMLTransformer(int(getenv("TRANSFORM_WORKERS", HTMLTransformer.WORKERS))),
+        popularity=Popularity(getenv("POPULARITY_SNAPSHOT", Popularity.STORE_PATH))
+    )
+game_history = GameHistory(getenv("GAME_HISTORY", GameHistory.STORE_PATH))
+if getenv("STATE_BACKEND", "memory") == "redis":
+    game_manager = GameManager(RedisStateBackend(getenv("REDIS_URL", "redis://localhost:6379/0"), wikipedia), game_history, float(getenv("RECONNECT_GRACE", GameManager.RECONNECT_GRACE)))
+    state_snapshot = None
+else:
+    game_manager = GameManager(InMemoryStateBackend(), game_history, float(getenv("RECONNECT_GRACE", GameManager.RECONNECT_GRACE)))
+    # Rooms from before a restart come back with their players detached, waiting for them to resume
+    state_snapshot = StateSnapshot(game_manager, wikipedia, getenv("STATE_SNAPSHOT", StateSnapshot.STORE_PATH))
+    state_snapshot.restore()
+    state_snapshot.start()
 response_generator = ResponseGenerator(game_manager, socketio)
-wikipedia = WikipediaAPI()
+pair_pool = PairPool(wikipedia.solver)
+pair_pool.start()
+autocomplete = Autocomplete.from_file_or_empty(wikipedia, getenv("TITLE_LIST", "assets/titles.tsv"))
+# Last run's most visited pages are fetched in the background so the first players after a deploy hit a warm cache
+wikipedia.popularity.start()
+wikipedia.popularity.warm(wikipedia.prefetcher, int(getenv("WARM_PAGES", 500)))
+
+def cache_stats() -> dict:
+    return {
+        "page_meta": wikipedia.page_cache.stats(),
+        "rendered_page": wikipedia.render_cache.stats(),
+        "autocomplete": autocomplete.remote.stats()
+    }
+
+def hit_ratio(stats: dict) -> float:
+    lookups = stats["hits"] + stats["misses"]
+    return stats["hits"] / lookups if lookups > 0 else 0.0
+
+# Read at scrape time from the stats the components already keep
+metrics.registry.callback("wikispeedrun_rooms_active", "Rooms that currently exist", "gauge", lambda: [((), len(game_manager.room_names()))])
+metrics.registry.callback("wikispeedrun_players_active", "Connected players", "gauge", lambda: [((), game_manager.player_count())])
+metrics.registry.callback("wikispeedrun_players_detached", "Players held for a resume without a socket", "gauge", lambda: [((), game_manager.detached_count())])
+metrics.registry.callback("wikispeedrun_connections_open", "Socket.IO sessions held by this worker", "gauge", lambda: [((), connection_gate.open_count())])
+metrics.registry.callback("wikispeedrun_cache_hits_total", "Cache hits", "counter", lambda: [((name,), stats["hits"]) for name, stats in cache_stats().items()], ("cache",))
+metrics.registry.callback("wikispeedrun_cache_misses_total", "Cache misses", "counter", lambda: [((name,), stats["misses"]) for name, stats in cache_stats().items()], ("cache",))
+metrics.registry.callback("wikispeedrun_cache_hit_ratio", "Cache hits over lookups since start", "gauge", lambda: [((name,), hit_ratio(stats)) for name, stats in cache_stats().items()], ("cache",))
+metrics.registry.callback("wikispeedrun_cache_bytes", "Bytes held by in-memory caches", "gauge", lambda: [((name,), stats["bytes"]) for name, stats in cache_stats().items()], ("cache",))
+metrics.registry.callback("wikispeedrun_upstream_queued", "Upstream requests waiting for rate budget", "gauge", lambda: [((priority,), stats["queued"]) for priority, stats in wikipedia.scheduler.stats().items()], ("priority",))
+metrics.registry.callback("wikispeedrun_upstream_dropped_total", "Upstream requests dropped after waiting too long", "counter", lambda: [((priority,), stats["dropped"]) for priority, stats in wikipedia.scheduler.stats().items()], ("priority",))
+metrics.registry.callback("wikispeedrun_upstream_coalesced_total", "Upstream fetches that joined one already in flight", "counter", lambda: [((), wikipedia.inflight.coalesced)])
+metrics.registry.callback("wikispeedrun_upstream_http_total", "Upstream HTTP requests, failures and pooled connections opened and reused", "counter", lambda: [((kind,), value) for kind, value in wikipedia.transport.stats().items()], ("kind",))
+metrics.registry.callback("wikispeedrun_html_bytes_total", "Page HTML bytes before and after the transform", "counter", lambda: [((stage,), value) for stage, value in wikipedia.transformer.stats().items()], ("stage",))
+metrics.registry.callback("wikispeedrun_game_history_pending", "Finished games waiting to be written", "gauge", lambda: [((), game_history.pending())])
+metrics.registry.callback("wikispeedrun_popularity_tracked", "Pages with a decayed access count", "gauge", lambda: [((), wikipedia.popularity.stats()["tracked"])])
+metrics.registry.callback("wikispeedrun_autocomplete_skipped_total", "Upstream autocomplete searches skipped because the client typed on", "counter", lambda: [((), autocomplete.skipped)])
+metrics.registry.callback("wikispeedrun_page_table_size", "Pages interned for live games", "gauge", lambda: [((), len(pages))])
+metrics.registry.callback("wikispeedrun_link_index_size", "Pages and interned link keys held by the link index", "gauge", lambda: [((kind,), value) for kind, value in wikipedia.links.stats().items()], ("kind",))
+metrics.registry.callback("wikispeedrun_link_index_compactions_total", "Times the link index dropped its oldest pages", "counter", lambda: [((), wikipedia.links.compactions)])
+metrics.registry.callback("wikispeedrun_prefetch_total", "Prefetch tasks by result", "counter", lambda: [((result,), count) for result, count in wikipedia.prefetcher.stats().items() if result != "queued"], ("result",))
 
 def e(e: E):
     return e.value
 
+def limited(handler):
+    # Drops events from clients over their rate limit before they reach the handler or the upstream API
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        if banmanager.allow_event(request.remote_addr, request.sid):
+            return handler(*args, **kwargs)
+        metrics.socket_events_dropped.inc(reason="rate_limited")
+        if banmanager.is_abusive(request.sid):
+            log.warning("disconnecting for flooding sid=%s ip=%s", request.sid, request.remote_addr)
+            disconnect()
+    return wrapper
+
+def synchronized(handler):
+    # Every socket event runs as one unit of work against the state backend, timed for /metrics
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        with metrics.socket_event_seconds.time(event=handler.__name__), game_manager.session():
+            return handler(*args, **kwargs)
+    return wrapper
+
 @app.route("/")
 def index():
     return render_template("index.html")
@@ -31,26 +134,171 @@ def index():
 def favicon():
     return send_file("static/favicon.ico")
 
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/healthz")
+def healthz():
+    # Load balancers stop routing here as soon as a drain starts
+    if connection_gate.draining:
+        return {"status": "draining", **connection_gate.stats()}, 503
+    return {"status": "ok", **connection_gate.stats()}
+
+PAGE_RETRY_AFTER = 2 # Seconds clients are told to wait when a page can't be fetched right now
+
+@app.route("/page/<path:key>")
+def page(key):
+    if banmanager.get_is_banned(request.remote_addr):
+        return {"status": "failure", "error": "Banned"}, 403
+    if not banmanager.allow_page(request.remote_addr):
+        return {"status": "failure", "error": "Too many requests"}, 429
+    try:
+        page = wikipedia.render_page(key)
+    except (StaleRequestError, requests.RequestException) as e:
+        # Out of upstream budget or Wikipedia itself failed, either way it's worth trying again shortly
+        log.warning("page unavailable key=%s error=%s", key, e)
+        return {"status": "failure", "error": "Wikipedia is busy, try again in a moment"}, 503, {"Retry-After": str(PAGE_RETRY_AFTER)}
+    if page is None:
+        return {"status": "failure", "error": PageNotFoundException.client_error}, 404
+    wikipedia.popularity.touch(page.key)
+
+    if request.if_none_match.contains(page.etag):
+        response = Response(status=304)
+    else:
+        encoding = request.accept_encodings.best_match(page.encodings.keys(), default="identity")
+        response = Response(page.body(encoding), mimetype="text/html")
+        if encoding in page.encodings:
+            response.headers["Content-Encoding"] = encoding
+
+    response.set_etag(page.etag)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "public, max-age=300"
+    response.headers["X-Page-Title"] = quote(page.title)
+    return response
+
+def query_limit() -> int:
+    try:
+        return int(request.args.get("limit", 10))
+    except ValueError:
+        return 10
+
+@app.route("/history/leaderboard")
+def history_leaderboard():
+    start, end = request.args.get("start", ""), request.args.get("end", "")
+    if start == "" or end == "":
+        return {"status": "failure", "error": MalformedRequestException.client_error}, 400
+    return {"status": "success", "runs": game_history.leaderboard(link_key(start), link_key(end), query_limit())}
+
+@app.route("/history/pairs")
+def history_pairs():
+    return {"status": "success", "pairs": game_history.popular_pairs(query_limit())}
+
+@app.route("/history/players/<name>")
+def history_player(name):
+    return {"status": "success", "games": game_history.player_games(name, query_limit())}
+
+@socketio.on(e(E.CONNECT))
+def connect():
+    if banmanager.get_is_banned(request.remote_addr):
+        log.info("blocking banned ip=%s", request.remote_addr)
+        raise ConnectionRefusedError("banned")
+    if not banmanager.allow_connection(request.remote_addr):
+        return False
+    if not connection_gate.try_open():
+        return False # Client backs off and retries, see connect_error in wikispeedrun.js
+
+# Not rate limited, a client coming back from a network blip reconnects fast and must get to resume.
+# Socket opens are already bounded by the connection gate and the per-IP connection bucket.
 @socketio.on(e(E.CLIENT_CONNECT))
-def client_connect():
+@synchronized
+def client_connect(data=None):
     client_ip = request.remote_addr
+    if game_manager.state.fetch_player(request.sid) is not None:
+        return # Only the first one per socket counts, repeats would otherwise mint players unlimited
     if banmanager.get_is_banned(client_ip):
-        print("Blocking connection for banned IP: " + client_ip)
+        # Banned after the socket was already open, the list is reloaded while running
+        log.info("blocking banned ip=%s sid=%s", client_ip, request.sid)
         response_generator.emit(E.FORCE_DISCONNECT, response_generator.success, request.sid)
-    else:
-        print("Allowing connection for IP:" + client_ip)
-    game_manager.create_player(request.sid)
-    print(request.sid + " connected")
+        return disconnect()
+
+    token = data.get("token") if isinstance(data, dict) else None
+    if isinstance(token, str):
+        try:
+            player, replaced = game_manager.resume_player(token, request.sid)
+            if replaced is not None:
+                disconnect(replaced, namespace="/") # The old connection is dead but hasn't timed out yet
+            response_generator.emit_resume(player)
+            log.debug("resumed sid=%s ip=%s room=%s", request.sid, client_ip, player.room.name if player.room is not None else None)
+            return
+        except GameManagerError:
+            pass # Expired or never existed, carry on as a new player
+
+    player = game_manager.create_player(request.sid)
+    response_generator.emit(E.SESSION, response_generator.success, request.sid, token=player.resume_token(), resumed=False)
+    log.debug("connected sid=%s ip=%s", request.sid, client_ip)
 
 
 @socketio.on(e(E.CLIENT_DISCONNECT))
+@synchronized
 def client_disconnect():
-    room = game_manager.remove_player(request.sid)
+    connection_gate.close()
+    banmanager.forget_sid(request.sid)
+    room, evicted = game_manager.disconnect_player(request.sid)
+    wikipedia.prefetcher.forget_player(request.sid)
+    autocomplete.forget(request.sid)
+    announce_departure(room, evicted)
+    log.debug("disconnected sid=%s", request.sid)
+
+def announce_departure(room: str|None, evicted: list[str]):
     if room is not None:
         response_generator.emit_room_update(room)
-    print(request.sid + " disconnected")
+    for spectator in evicted:
+        response_generator.emit(E.LEAVE_ROOM_RESPONSE, response_generator.success, spectator) # Last player left, nothing to watch
+
+def disconnect_idle_sessions() -> int:
+    # For shutdown: drops every session on this worker that isn't in a running race, they resume on the
+    # next process. Returns how many are still racing.
+    racing = 0
+    for sid, _ in list(socketio.server.manager.get_participants("/", None)):
+        player = game_manager.state.fetch_player(sid) # Read only, no session so no room locks are taken
+        if player is not None and player.room is not None and player.room.is_playing():
+            racing += 1
+        else:
+            socketio.server.disconnect(sid, namespace="/")
+    return racing
+
+DETACHED_SWEEP = 1 # Seconds between checks for detached players whose grace period ran out
+
+def expire_detached_players():
+    while True:
+        socketio.sleep(DETACHED_SWEEP)
+        try:
+            with app.app_context(), game_manager.session():
+                for room, evicted in game_manager.expire_detached():
+                    announce_departure(room, evicted)
+        except Exception:
+            log.exception("expiring detached players failed")
+
+socketio.start_background_task(expire_detached_players)
+
+PAGE_SWEEP = 5 * 60 # Seconds between freeing page table entries no live game refers to
+
+def sweep_pages():
+    while True:
+        socketio.sleep(PAGE_SWEEP)
+        try:
+            with game_manager.session():
+                freed = game_manager.sweep_pages()
+            log.debug("swept page table freed=%d size=%d", freed, len(pages))
+        except Exception:
+            log.exception("sweeping the page table failed")
+
+socketio.start_background_task(sweep_pages)
 
 @socketio.on(e(E.TRY_JOIN_ROOM))
+@limited
+@synchronized
 def try_join_room(data):
     try:
         game_manager.join_room(
@@ -58,14 +306,17 @@ def try_join_room(data):
             game_manager.get_room(data["room"]),
             data["code"]
         )
-        response_generator.emit(E.JOIN_ROOM_RESPONSE, response_generator.room_info, room=data["room"], player=request.sid)
+        response_generator.emit(E.JOIN_ROOM_RESPONSE, response_generator.room_snapshot, room=data["room"], player=request.sid)
         response_generator.emit_room_update(data["room"])
     except GameManagerError as e:
         response_generator.emit_error_response(E.JOIN_ROOM_RESPONSE, e)
 
 @socketio.on(e(E.TRY_CREATE_ROOM))
+@limited
+@synchronized
 def try_create_room(data):
     try:
+        game_manager.validate_not_in_room(game_manager.get_player(request.sid)) # Before the room exists, not after
         room = game_manager.create_room(
             data["room"],
             wikipedia,
@@ -79,25 +330,52 @@ def try_create_room(data):
         )
         response_generator.emit(
             E.JOIN_ROOM_RESPONSE, 
-            response_generator.room_info, 
+            response_generator.room_snapshot, 
             room=data["room"],
             player=request.sid
         )
     except GameManagerError as e:
         response_generator.emit_error_response(E.JOIN_ROOM_RESPONSE, e)
 
+@socketio.on(e(E.TRY_SPECTATE_ROOM))
+@limited
+@synchronized
+def try_spectate_room(data):
+    try:
+        room = game_manager.get_room(data["room"])
+        game_manager.spectate_room(game_manager.get_player(request.sid), room, data["code"])
+        response_generator.emit(E.JOIN_ROOM_RESPONSE, response_generator.room_snapshot, room=data["room"], player=request.sid)
+        response_generator.emit_room_update(data["room"])
+        response_generator.flush_progress(room, request.sid) # Mid race they shouldn't wait for the next tick to see anything
+    except GameManagerError as e:
+        response_generator.emit_error_response(E.JOIN_ROOM_RESPONSE, e)
+
 @socketio.on(e(E.TRY_LEAVE_ROOM))
+@limited
+@synchronized
 def leave_room():
     try:
-        player = game_manager.get_player(request.sid)
-        room = player.room.name
-        player.room.remove_player(player)
+        room, evicted = game_manager.leave_room(game_manager.get_player(request.sid))
         response_generator.emit(E.LEAVE_ROOM_RESPONSE, response_generator.success)
-        response_generator.emit_room_update(room)
+        announce_departure(room, evicted)
     except GameManagerError as e:
         response_generator.emit_error_response(E.LEAVE_ROOM_RESPONSE, e)
 
+@socketio.on(e(E.RESYNC_ROOM))
+@limited
+@synchronized
+def resync_room():
+    try:
+        player = game_manager.get_player(request.sid)
+        if player.room is None:
+            raise PlayerNotInRoomException("Resyncing room")
+        response_generator.emit_room_update(player.room.name, request.sid)
+    except GameManagerError as e:
+        response_generator.emit_error_response(E.ROOM_UPDATE, e)
+
 @socketio.on(e(E.RETURN_TO_ROOM_SETTINGS))
+@limited
+@synchronized
 def return_to_room_settings():
     try:
         player = game_manager.get_player(request.sid)
@@ -110,18 +388,20 @@ def return_to_room_settings():
         response_generator.emit_error_response(E.LEAVE_ROOM_RESPONSE, e)
 
 @socketio.on(e(E.TRY_CHANGE_USERNAME))
+@limited
+@synchronized
 def change_username(data):
     try:
         player = game_manager.get_player(request.sid)
         game_manager.change_username(player.room, player, data["username"])
         response_generator.emit(E.CHANGE_USERNAME_RESPONSE, response_generator.success, request.sid, username=player.name)
         response_generator.emit_room_update(player.room.name)
-        print("Emitted name change room update")
     except GameManagerError as e:
-        print("Bad username")
         response_generator.emit_error_response(E.CHANGE_USERNAME_RESPONSE, e)
 
 @socketio.on(e(E.SEARCH_PAGES))
+@limited
+@synchronized
 def search_pages(data):
     try:
         
@@ -131,18 +411,82 @@ def search_pages(data):
         player = game_manager.get_player(request.sid)
         game_manager.validate_owns_room(player)
 
-        page = wikipedia.search_user_page_or_none(data["query"])
+        match = autocomplete.index.exact(data["query"])
+        if match is not None:
+            page = PageMeta(match["title"], match["key"])
+            wikipedia.popularity.touch(match["key"])
+        else:
+            try:
+                with prioritized(Priority.SEARCH):
+                    page = wikipedia.search_user_page_or_none(data["query"])
+            except StaleRequestError:
+                page = None
 
         if page == None:
             response_generator.emit_error_response(E.SEARCH_PAGES, PageNotFoundException("Searching for page"))
         
         player.room.settings.set_member(data["element"], page)
         response_generator.emit_room_update(player.room.name)
+        if page is not None:
+            wikipedia.prefetcher.warm(player.room.name, page.page_id)
         
     except GameManagerError as e:
         response_generator.emit_error_response(E.SEARCH_PAGES, e)
 
+@socketio.on(e(E.AUTOCOMPLETE))
+@limited
+@synchronized
+def autocomplete_pages(data):
+    try:
+        if not data["element"] in ("start_article", "end_article"):
+            raise MalformedRequestException("Autocompleting pages")
+
+        player = game_manager.get_player(request.sid)
+        game_manager.validate_owns_room(player)
+
+        query = data["query"]
+        suggestions = autocomplete.lookup(query)
+        if suggestions is not None:
+            return response_generator.emit(E.AUTOCOMPLETE, response_generator.suggestions, request.sid, query=query, element=data["element"], suggestions=suggestions)
+
+        autocomplete.submit(request.sid, query, send_remote_suggestions, request.sid, query, data["element"])
+    except GameManagerError as e:
+        response_generator.emit_error_response(E.AUTOCOMPLETE, e)
+
+def send_remote_suggestions(sid: str, query: str, element: str):
+    try:
+        with prioritized(Priority.SEARCH):
+            suggestions = autocomplete.fetch(query)
+    except Exception as e:
+        log.warning("autocomplete search failed query=%r error=%s", query, e)
+        suggestions = []
+    response_generator.emit(E.AUTOCOMPLETE, response_generator.suggestions, sid, query=query, element=element, suggestions=suggestions)
+
+@socketio.on(e(E.RANDOM_PAIR))
+@limited
+@synchronized
+def random_pair(data):
+    try:
+        player = game_manager.get_player(request.sid)
+        game_manager.validate_owns_room(player)
+
+        try:
+            difficulty = Difficulty(data["difficulty"])
+        except (KeyError, ValueError):
+            raise MalformedRequestException("Randomizing articles")
+
+        settings = player.room.settings
+        settings.randomize_articles(pair_pool, difficulty)
+        response_generator.emit_room_update(player.room.name)
+        wikipedia.prefetcher.warm(player.room.name, settings.start_article.page_id)
+        wikipedia.prefetcher.warm(player.room.name, settings.end_article.page_id)
+
+    except GameManagerError as e:
+        response_generator.emit_error_response(E.RANDOM_PAIR, e)
+
 @socketio.on(e(E.TRY_START_GAME))
+@limited
+@synchronized
 def start_game():
     try:
         
@@ -153,6 +497,8 @@ def start_game():
         response_generator.emit_error_response(E.START_GAME_RESPONSE, e)
 
 @socketio.on(e(E.SEND_CHAT_MESSAGE))
+@limited
+@synchronized
 def send_chat_message(data):
     try:
         player = game_manager.get_player(request.sid)
@@ -161,13 +507,16 @@ def send_chat_message(data):
         response_generator.emit_error_response(E.SEND_CHAT_MESSAGE, e)
 
 @socketio.on(e(E.GAME_MODE_EVENT))
+@limited
+@synchronized
 def game_mode_event(data):
     try:
         player = game_manager.get_player(request.sid)
-        print(data)
+        game_manager.validate_racing(player)
         player.room.settings.mode.user_event(data["event"], data).handle(response_generator, player.room, wikipedia, player, data)
     except GameManagerError as e:
         response_generator.emit_error_response(E.GAME_MODE_EVENT, e)
 
 if __name__ == "__main__":
-    socketio.run(app, debug=getenv("DEBUG", False), host="0.0.0.0")
\ No newline at end of file
+    # Development server, use serve.py in production
+    socketio.run(app, debug=getenv("DEBUG", False), host=getenv("HOST", "0.0.0.0"), port=int(getenv("PORT", 5000)))
\ No newline at end of file
@@ -0,0 +1,151 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Minimal Prometheus text exposition, enough for the handful of metrics served on /metrics without
+# pulling in a client library. Everything here is safe to call from any thread on the hot path.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+RATIO_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95)
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra != "":
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def samples(self) -> list[str]:
+        return []
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> list[str]:
+        with self.lock:
+            values = list(self.values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self.series: dict[tuple, list] = {} # Label values -> [bucket counts, sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        position = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = [[0] * len(self.buckets), 0.0, 0]
+                self.series[key] = series
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> list[str]:
+        with self.lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self.series.items()]
+        lines = []
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+class Callback(Metric):
+    # Read from somewhere else at scrape time, the function returns [(label values, value), ...]
+    def __init__(self, name: str, help: str, kind: str, function, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        self.kind = kind
+        self.function = function
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in self.function()]
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def callback(self, name: str, help: str, kind: str, function, labels: tuple = ()) -> Callback:
+        return self.register(Callback(name, help, kind, function, labels))
+
+    def render(self) -> str:
+        rendered = []
+        for metric in list(self.metrics.values()):
+            try:
+                rendered.append(metric.render())
+            except Exception:
+                continue # One broken source shouldn't take the whole scrape down
+        return "\n".join(rendered) + "\n"
+
+registry = Registry()
+
+socket_event_seconds = registry.histogram("wikispeedrun_socket_event_seconds", "Time spent handling a socket event", ("event",))
+sessions = registry.counter("wikispeedrun_sessions_total", "Player sessions started, detached, resumed and expired", ("result",))
+socket_events_dropped = registry.counter("wikispeedrun_socket_events_dropped_total", "Socket events dropped before reaching their handler", ("reason",))
+task_seconds = registry.histogram("wikispeedrun_task_seconds", "Time spent in background game tasks", ("task",))
+upstream_seconds = registry.histogram("wikispeedrun_upstream_request_seconds", "Upstream Wikimedia request latency", ("endpoint", "status"))
+upstream_wait_seconds = registry.histogram("wikispeedrun_upstream_wait_seconds", "Time upstream requests waited for rate budget", ("priority",))
+emit_fanout = registry.histogram("wikispeedrun_emit_fanout", "Local sockets reached by one emit", ("event",), SIZE_BUCKETS)
+html_reduction = registry.histogram("wikispeedrun_html_reduction_ratio", "Fraction of upstream page bytes removed before delivery", (), RATIO_BUCKETS)
@@ -0,0 +1,197 @@
+import os
+import sys
+import gzip
+import json
+import mmap
+import zlib
+import struct
+from urllib.parse import unquote
+from pagecache import PageMetaCache, PageRecord, normalize_key
+from wiki import WikipediaAPI
+
+# Bundle layout:
+#   titles.idx   - MAGIC, entry count, then fixed size entries sorted by casefolded key
+#   keys.bin     - utf-8 keys referenced by the index
+#   articles.bin - zlib'd "title\nhtml" blobs for articles, utf-8 target keys for redirects
+MAGIC = b"WSRIDX1\0"
+HEADER = struct.Struct("<8sQ")
+ENTRY = struct.Struct("<QIQII") # key offset, key length, data offset, data length, kind
+
+KIND_ARTICLE = 0
+KIND_REDIRECT = 1
+
+class BundleIndex:
+    def __init__(self, path: str):
+        self.files = [open(os.path.join(path, name), "rb") for name in ("titles.idx", "keys.bin", "articles.bin")]
+        self.index, self.keys, self.articles = [self._map(file) for file in self.files]
+
+        magic, self.count = HEADER.unpack_from(self.index, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a WikiSpeedrun bundle: " + path)
+
+    def _map(self, file) -> mmap.mmap|bytes:
+        if os.fstat(file.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def entry(self, position: int) -> tuple:
+        return ENTRY.unpack_from(self.index, HEADER.size + position * ENTRY.size)
+
+    def key(self, position: int) -> str:
+        key_offset, key_length, _, _, _ = self.entry(position)
+        return self.keys[key_offset:key_offset + key_length].decode("utf-8")
+
+    def data(self, position: int) -> tuple[int, bytes]:
+        _, _, data_offset, data_length, kind = self.entry(position)
+        return kind, self.articles[data_offset:data_offset + data_length]
+
+    def lower_bound(self, folded: str) -> int:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle).casefold() < folded:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def find(self, key: str) -> int|None:
+        folded = key.casefold()
+        position = self.lower_bound(folded)
+        while position < self.count:
+            candidate = self.key(position)
+            if candidate.casefold() != folded:
+                break
+            if candidate == key:
+                return position
+            position += 1
+        return None
+
+    def prefix(self, prefix: str, limit: int) -> list[int]:
+        folded = prefix.casefold()
+        position = self.lower_bound(folded)
+        positions = []
+        while position < self.count and len(positions) < limit:
+            if not self.key(position).casefold().startswith(folded):
+                break
+            positions.append(position)
+            position += 1
+        return positions
+
+    def close(self):
+        for mapped in (self.index, self.keys, self.articles):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        for file in self.files:
+            file.close()
+
+class OfflineWikipediaAPI(WikipediaAPI):
+    def __init__(self, bundle_path: str):
+        super().__init__(page_cache=PageMetaCache(store_path=None))
+        self.bundle = BundleIndex(bundle_path)
+
+    def search_pages(self, query: str, limit: int = 1) -> list:
+        key = normalize_key(query)
+        positions = self.bundle.prefix(key, limit)
+        exact = self.bundle.find(key)
+        if exact is not None and exact not in positions:
+            positions = [exact] + positions[:limit - 1]
+
+        return [{
+            "id": position,
+            "key": self.bundle.key(position),
+            "title": self.bundle.key(position).replace("_", " "),
+            "description": ""
+        } for position in positions]
+
+    def fetch_page_object(self, key: str) -> PageRecord:
+        position = self.bundle.find(key)
+        if position is None:
+            return PageRecord(key, missing=True)
+
+        kind, data = self.bundle.data(position)
+        if kind == KIND_REDIRECT:
+            return PageRecord(key, key.replace("_", " "), key, data.decode("utf-8"))
+        return PageRecord(key, self._unpack(data)[0], key)
+
+    def fetch_page_html(self, key: str) -> str:
+        position = self.bundle.find(key)
+        if position is None:
+            return ""
+        kind, data = self.bundle.data(position)
+        if kind == KIND_REDIRECT:
+            return self.fetch_page_html(data.decode("utf-8"))
+        return self._unpack(data)[1]
+
+    def _unpack(self, data: bytes) -> tuple[str, str]:
+        title, _, page_html = zlib.decompress(data).decode("utf-8").partition("\n")
+        return title, page_html
+
+# Bundle building
+def _read_html_directory(source: str):
+    for name in os.listdir(source):
+        if name.endswith(".html"):
+            key = unquote(name[:-len(".html")])
+            with open(os.path.join(source, name), "r", encoding="utf-8") as html_file:
+                yield key, key.replace("_", " "), html_file.read(), ()
+
+    redirects_path = os.path.join(source, "redirects.tsv")
+    if os.path.exists(redirects_path):
+        with open(redirects_path, "r", encoding="utf-8") as redirects_file:
+            for line in redirects_file:
+                if "\t" in line:
+                    alias, target = line.rstrip("\n").split("\t", 1)
+                    yield alias, alias, None, (target,)
+
+def _read_enterprise_dump(source: str):
+    # Wikimedia Enterprise HTML dumps: one JSON article per line
+    opener = gzip.open if source.endswith(".gz") else open
+    with opener(source, "rt", encoding="utf-8") as dump_file:
+        for line in dump_file:
+            article = json.loads(line)
+            title = article["name"]
+            yield title, title, article["article_body"]["html"], [redirect["name"] for redirect in article.get("redirects", [])]
+
+def build_bundle(source: str, bundle_path: str):
+    os.makedirs(bundle_path, exist_ok=True)
+    reader = _read_html_directory(source) if os.path.isdir(source) else _read_enterprise_dump(source)
+
+    entries = [] # (key, data offset, data length, kind)
+    with open(os.path.join(bundle_path, "articles.bin"), "wb") as articles_file:
+        offset = 0
+        for key, title, page_html, redirects in reader:
+            key = normalize_key(key)
+            if page_html is None: # Standalone redirect, redirects holds its target
+                data = normalize_key(redirects[0]).encode("utf-8")
+                kind = KIND_REDIRECT
+            else:
+                data = zlib.compress((title + "\n" + page_html).encode("utf-8"), 6)
+                kind = KIND_ARTICLE
+            articles_file.write(data)
+            entries.append((key, offset, len(data), kind))
+            offset += len(data)
+
+            if page_html is not None:
+                target = key.encode("utf-8")
+                for alias in redirects:
+                    articles_file.write(target)
+                    entries.append((normalize_key(alias), offset, len(target), KIND_REDIRECT))
+                    offset += len(target)
+
+    entries.sort(key=lambda entry: (entry[0].casefold(), entry[0]))
+    with open(os.path.join(bundle_path, "keys.bin"), "wb") as keys_file, open(os.path.join(bundle_path, "titles.idx"), "wb") as index_file:
+        index_file.write(HEADER.pack(MAGIC, len(entries)))
+        key_offset = 0
+        for key, data_offset, data_length, kind in entries:
+            encoded = key.encode("utf-8")
+            keys_file.write(encoded)
+            index_file.write(ENTRY.pack(key_offset, len(encoded), data_offset, data_length, kind))
+            key_offset += len(encoded)
+
+    return len(entries)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "build":
+        print("Usage: python offlinewiki.py build <html directory|enterprise dump .ndjson[.gz]> <bundle directory>")
+        sys.exit(1)
+    print("Wrote", build_bundle(sys.argv[2], sys.argv[3]), "entries to", sys.argv[3])
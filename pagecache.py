@@ -0,0 +1,225 @@
+import os
+import sys
+import gzip
+import hashlib
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+class PageRecord:
+    def __init__(self, key: str, title: str = "", canonical_key: str = "", redirect_target: str = "", missing: bool = False, fetched_at: float = None):
+        self.key = key # Key the page was requested by
+        self.title = title
+        self.canonical_key = canonical_key if canonical_key != "" else key
+        self.redirect_target = redirect_target # Key of the page this one redirects to, "" if none
+        self.missing = missing # Negative entry for pages that 404 upstream
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+
+    def size(self) -> int:
+        return (sys.getsizeof(self)
+                + sys.getsizeof(self.key)
+                + sys.getsizeof(self.title)
+                + sys.getsizeof(self.canonical_key)
+                + sys.getsizeof(self.redirect_target))
+
+def normalize_key(key: str) -> str:
+    return key.strip().replace(" ", "_")
+
+class LRUCache:
+    def __init__(self, max_bytes: int, ttl: float = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict() # key -> (value, size, expires_at)
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default = None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, size: int, ttl: float = None):
+        ttl = ttl if ttl is not None else self.ttl
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self.entries[key] = (value, size, time.time() + ttl if ttl is not None else None)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+class PageStore:
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                key TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                canonical_key TEXT NOT NULL,
+                redirect_target TEXT NOT NULL,
+                missing INTEGER NOT NULL,
+                fetched_at REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+
+    def get(self, key: str) -> PageRecord|None:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT key, title, canonical_key, redirect_target, missing, fetched_at FROM pages WHERE key = ?",
+                (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return PageRecord(row[0], row[1], row[2], row[3], bool(row[4]), row[5])
+
+    def put(self, record: PageRecord):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+                (record.key, record.title, record.canonical_key, record.redirect_target, int(record.missing), record.fetched_at)
+            )
+
+    def delete(self, key: str):
+        with self.lock:
+            self.connection.execute("DELETE FROM pages WHERE key = ?", (key,))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+class PageMetaCache:
+    MAX_BYTES = 32 * 1024 * 1024
+    TTL = 24 * 60 * 60 # Pages rarely get renamed, a day is plenty fresh
+    MISSING_TTL = 10 * 60 # Keep 404s short so newly created pages show up
+    STORE_PATH = "cache/pages.sqlite3"
+
+    def __init__(self, store_path: str|None = STORE_PATH, max_bytes: int = MAX_BYTES):
+        self.memory = LRUCache(max_bytes, self.TTL)
+        self.store = PageStore(store_path) if store_path is not None else None
+        self.store_hits = 0
+        self.store_misses = 0
+
+    def _ttl(self, record: PageRecord) -> float:
+        return self.MISSING_TTL if record.missing else self.TTL
+
+    def get(self, key: str) -> PageRecord|None:
+        key = normalize_key(key)
+        record = self.memory.get(key)
+        if record is not None or self.store is None:
+            return record
+
+        record = self.store.get(key)
+        if record is None or record.fetched_at + self._ttl(record) < time.time():
+            self.store_misses += 1
+            return None
+
+        self.store_hits += 1
+        self._remember(record)
+        return record
+
+    def put(self, record: PageRecord):
+        record.key = normalize_key(record.key)
+        self._remember(record)
+        if self.store is not None:
+            self.store.put(record)
+
+    def _remember(self, record: PageRecord):
+        remaining = record.fetched_at + self._ttl(record) - time.time()
+        self.memory.put(record.key, record, record.size(), remaining)
+
+    def stats(self) -> dict:
+        stats = self.memory.stats()
+        stats["store_hits"] = self.store_hits
+        stats["store_misses"] = self.store_misses
+        return stats
+
+class RenderedPage:
+    def __init__(self, key: str, title: str, html: str, links: list[str] = ()):
+        self.key = key # Resolved key (after redirects)
+        self.title = title
+        self.links = tuple(links) # Outbound article links in document order
+        self.html = html.encode("utf-8")
+        self.etag = hashlib.sha1(self.html).hexdigest()
+        self.encodings = {} # Ordered by preference
+        if brotli is not None:
+            self.encodings["br"] = brotli.compress(self.html, quality=5)
+        self.encodings["gzip"] = gzip.compress(self.html, compresslevel=6)
+
+    def body(self, encoding: str) -> bytes:
+        return self.encodings.get(encoding, self.html)
+
+    def size(self) -> int:
+        return (len(self.html)
+                + sum(len(body) for body in self.encodings.values())
+                + sys.getsizeof(self.title)
+                + sum(sys.getsizeof(link) for link in self.links))
+
+class RenderedPageCache:
+    MAX_BYTES = 256 * 1024 * 1024
+    TTL = 60 * 60
+
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        self.memory = LRUCache(max_bytes, self.TTL)
+
+    def get(self, key: str) -> RenderedPage|None:
+        return self.memory.get(normalize_key(key))
+
+    def put(self, page: RenderedPage):
+        self.memory.put(normalize_key(page.key), page, page.size())
+
+    def stats(self) -> dict:
+        return self.memory.stats()
@@ -0,0 +1,75 @@
+import threading
+
+class PageTable:
+    # Interning of page keys: every page is stored once and referred to by a small integer ID, so player
+    # paths and room settings share one copy of each key and title. IDs nothing refers to any more are
+    # freed by sweep and handed out again, so the table only grows with the pages in live games.
+    def __init__(self):
+        self.ids: dict[str, int] = {}
+        self.keys: list[str|None] = [] # None for freed IDs
+        self.titles: list[str|None] = [] # None until someone tells us the display title
+        self.free: list[int] = []
+        self.unused: set[int] = set() # Unreferenced at the last sweep, freed at the next one unless interned again
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_keys(cls, keys: list[str]) -> 'PageTable':
+        table = cls()
+        table.keys = keys
+        table.titles = [None] * len(keys)
+        table.ids = dict(zip(keys, range(len(keys))))
+        return table
+
+    def intern(self, key: str, title: str = None) -> int:
+        page_id = self.ids.get(key)
+        if page_id is None:
+            with self.lock:
+                page_id = self.ids.get(key)
+                if page_id is None:
+                    if len(self.free) > 0:
+                        page_id = self.free.pop()
+                        self.keys[page_id] = key
+                    else:
+                        page_id = len(self.keys)
+                        self.keys.append(key)
+                        self.titles.append(None)
+                    self.ids[key] = page_id
+        elif page_id in self.unused:
+            self.unused.discard(page_id) # Someone is holding on to it after all
+        if title is not None and self.titles[page_id] != title:
+            self.titles[page_id] = title
+        return page_id
+
+    def lookup(self, key: str) -> int|None:
+        return self.ids.get(key)
+
+    def key(self, page_id: int) -> str:
+        return self.keys[page_id]
+
+    def title(self, page_id: int) -> str:
+        title = self.titles[page_id]
+        if title is None:
+            return self.keys[page_id].replace("_", " ")
+        return title
+
+    def sweep(self, live: set[int]) -> int:
+        # Frees IDs that weren't in live at this sweep or the one before. Waiting a sweep means an ID
+        # interned by an event that hasn't stored it anywhere yet is never pulled out from under it.
+        with self.lock:
+            freed = 0
+            for page_id in self.unused - live:
+                key = self.keys[page_id]
+                if key is None:
+                    continue
+                del self.ids[key]
+                self.keys[page_id] = None
+                self.titles[page_id] = None
+                self.free.append(page_id)
+                freed += 1
+            self.unused = set(self.ids.values()) - live
+            return freed
+
+    def __len__(self):
+        return len(self.ids)
+
+pages = PageTable()
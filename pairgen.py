@@ -0,0 +1,122 @@
+import time
+import logging
+import random
+import threading
+from enum import Enum
+from collections import deque
+from array import array
+from pathsolver import PathSolver
+from linkindex import run_in
+
+log = logging.getLogger(__name__)
+
+class Difficulty(Enum):
+    EASY = "easy"
+    MEDIUM = "medium"
+    HARD = "hard"
+
+# Target distances and whether the endpoints should be well linked hubs. Distances are measured on the
+# pages players have opened so far, so they're upper bounds, the real shortest path can be shorter.
+DIFFICULTY_TARGETS = {
+    Difficulty.EASY: ((2,), True),
+    Difficulty.MEDIUM: ((3,), True),
+    Difficulty.HARD: ((4, 5, 6), False)
+}
+
+def sample_pairs(offsets: array, targets: array, reverse_offsets: array, samples: int, max_depth: int, max_visited: int, popular_in_degree: int, pool_size: int) -> dict[str, list[tuple[int, int]]]:
+    # Runs in a worker process, a BFS per root over a big graph would stall every socket otherwise
+    candidates = {difficulty.value: [] for difficulty in Difficulty}
+    seen = {difficulty.value: 0 for difficulty in Difficulty}
+    sources = [node for node in range(len(offsets) - 1) if offsets[node + 1] > offsets[node]]
+    for source in random.sample(sources, min(samples, len(sources))):
+        distances = bfs_distances(offsets, targets, source, max_depth, max_visited)
+        for target, distance in distances.items():
+            if target == source or offsets[target + 1] == offsets[target]:
+                continue # Only pick endpoints whose links we've seen so they're real articles
+            popular = reverse_offsets[target + 1] - reverse_offsets[target] >= popular_in_degree and reverse_offsets[source + 1] - reverse_offsets[source] >= popular_in_degree
+            for difficulty, (target_distances, wants_popular) in DIFFICULTY_TARGETS.items():
+                if distance in target_distances and (popular or not wants_popular):
+                    # Reservoir sample so a refresh never holds more than pool_size pairs per difficulty
+                    seen[difficulty.value] += 1
+                    pairs = candidates[difficulty.value]
+                    if len(pairs) < pool_size:
+                        pairs.append((source, target))
+                    else:
+                        slot = random.randrange(seen[difficulty.value])
+                        if slot < pool_size:
+                            pairs[slot] = (source, target)
+    return candidates
+
+def bfs_distances(offsets: array, targets: array, source: int, max_depth: int, max_visited: int) -> dict[int, int]:
+    distances = {source: 0}
+    queue = deque([source])
+    while queue:
+        node = queue.popleft()
+        depth = distances[node] + 1
+        if depth > max_depth:
+            continue
+        if len(distances) >= max_visited:
+            break
+        for neighbour in targets[offsets[node]:offsets[node + 1]]:
+            if neighbour not in distances:
+                distances[neighbour] = depth
+                queue.append(neighbour)
+    return distances
+
+class PairPool:
+    POOL_SIZE = 256 # Pairs kept per difficulty
+    REFRESH_INTERVAL = 60 # Seconds between background refreshes
+    SAMPLES_PER_REFRESH = 64 # BFS roots explored per refresh
+    MAX_DEPTH = 6
+    MAX_VISITED = 200_000 # Per BFS root, keeps a refresh bounded on big graphs
+    POPULAR_IN_DEGREE = 50 # In-links needed for an endpoint to count as popular
+
+    def __init__(self, solver: PathSolver):
+        self.solver = solver
+        self.pools: dict[Difficulty, list[tuple[str, str]]] = {difficulty: [] for difficulty in Difficulty}
+        self.stop = threading.Event()
+        self.thread: threading.Thread = None
+        self.refreshed_at = 0
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._refresh_loop, name="pair-pool", daemon=True)
+            self.thread.start()
+
+    def close(self):
+        self.stop.set()
+
+    def pick(self, difficulty: Difficulty) -> tuple[str, str]|None:
+        pool = self.pools[difficulty]
+        if len(pool) == 0:
+            return None
+        return random.choice(pool)
+
+    def _refresh_loop(self):
+        while not self.stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                log.exception("pair pool refresh failed")
+            self.stop.wait(self.REFRESH_INTERVAL)
+
+    def refresh(self):
+        graph = self.solver.current_graph()
+        if graph is None or graph.nodes == 0:
+            return
+
+        candidates = run_in(self.solver.pool, sample_pairs, graph.offsets, graph.targets, graph.reverse_offsets, self.SAMPLES_PER_REFRESH, self.MAX_DEPTH, self.MAX_VISITED, self.POPULAR_IN_DEGREE, self.POOL_SIZE)
+
+        pools = {}
+        for difficulty in Difficulty:
+            pairs = candidates[difficulty.value]
+            if len(pairs) > 0:
+                pools[difficulty] = [(graph.table.key(source), graph.table.key(target)) for source, target in pairs]
+            else:
+                pools[difficulty] = self.pools[difficulty]
+
+        self.pools = pools # Swapped in one go so pick never sees a half built pool
+        self.refreshed_at = time.time()
+
+    def stats(self) -> dict:
+        return {difficulty.value: len(pool) for difficulty, pool in self.pools.items()}
@@ -0,0 +1,188 @@
+import time
+import logging
+import threading
+from array import array
+from concurrent.futures import Executor
+from pagetable import PageTable
+from linkindex import LinkIndex, link_key, pack, run_in
+
+log = logging.getLogger(__name__)
+
+def build_csr(nodes: int, sources: array, lengths: array, flat: array) -> tuple[array, array, array, array]:
+    # Runs in a worker process, every loop here is over every edge
+    starts = array("I", [0]) * (nodes + 1)
+    position = 0
+    for source, length in zip(sources, lengths):
+        starts[source] = position
+        position += length
+
+    offsets = array("I", [0]) * (nodes + 1)
+    for source, length in zip(sources, lengths):
+        offsets[source + 1] = length
+    for node in range(nodes):
+        offsets[node + 1] += offsets[node]
+
+    targets = array("I", [0]) * len(flat)
+    in_degree = array("I", [0]) * (nodes + 1)
+    for source, length in zip(sources, lengths):
+        start = starts[source]
+        targets[offsets[source]:offsets[source] + length] = flat[start:start + length]
+    for target in targets:
+        in_degree[target + 1] += 1
+
+    reverse_offsets = in_degree
+    for node in range(nodes):
+        reverse_offsets[node + 1] += reverse_offsets[node]
+
+    reverse_targets = array("I", [0]) * len(targets)
+    fill = array("I", reverse_offsets[:nodes])
+    for node in range(nodes):
+        for position in range(offsets[node], offsets[node + 1]):
+            target = targets[position]
+            reverse_targets[fill[target]] = node
+            fill[target] += 1
+    return offsets, targets, reverse_offsets, reverse_targets
+
+class LinkGraph:
+    # Compressed sparse row adjacency: the links of node n are targets[offsets[n]:offsets[n+1]]
+    def __init__(self, offsets: array, targets: array, reverse_offsets: array, reverse_targets: array, pages: int, table: PageTable):
+        self.offsets = offsets
+        self.targets = targets
+        self.reverse_offsets = reverse_offsets
+        self.reverse_targets = reverse_targets
+        self.pages = pages # Number of indexed pages the graph was built from
+        self.table = table # Names the nodes, the link index may have moved on to a new table since
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def from_index(cls, link_index: LinkIndex, pool: Executor = None) -> 'LinkGraph':
+        with link_index.lock:
+            view = link_index.view
+            pages = list(view.links.items())
+        sources, lengths, flat = pack(pages)
+        nodes = len(view.table) # Every ID packed above is already in the table
+        return cls(*run_in(pool, build_csr, nodes, sources, lengths, flat), len(pages), view.table)
+
+    @property
+    def nodes(self) -> int:
+        return len(self.offsets) - 1
+
+    def out_links(self, node: int):
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def in_links(self, node: int):
+        return self.reverse_targets[self.reverse_offsets[node]:self.reverse_offsets[node + 1]]
+
+    def in_degree(self, node: int) -> int:
+        return self.reverse_offsets[node + 1] - self.reverse_offsets[node]
+
+    def shortest_path(self, source: int, target: int, time_budget: float, max_visited: int) -> list[int]|None:
+        if source >= self.nodes or target >= self.nodes:
+            return None
+        if source == target:
+            return [source]
+
+        deadline = time.monotonic() + time_budget
+        forward = {source: (-1, 0)} # Node -> (parent, depth)
+        backward = {target: (-1, 0)}
+        forward_frontier = [source]
+        backward_frontier = [target]
+
+        while forward_frontier and backward_frontier:
+            # Expand whichever side is cheaper, finishing the whole layer so the best meeting point wins
+            expand_forward = len(forward_frontier) <= len(backward_frontier)
+            frontier = forward_frontier if expand_forward else backward_frontier
+            visited, other = (forward, backward) if expand_forward else (backward, forward)
+            offsets, edges = (self.offsets, self.targets) if expand_forward else (self.reverse_offsets, self.reverse_targets)
+
+            next_frontier = []
+            best = None
+            for count, node in enumerate(frontier):
+                if count & 1023 == 0 and time.monotonic() > deadline:
+                    return None
+                depth = visited[node][1] + 1
+                for position in range(offsets[node], offsets[node + 1]):
+                    neighbour = edges[position]
+                    if neighbour in visited:
+                        continue
+                    visited[neighbour] = (node, depth)
+                    next_frontier.append(neighbour)
+                    if neighbour in other:
+                        length = depth + other[neighbour][1]
+                        if best is None or length < best[0]:
+                            best = (length, neighbour)
+
+            if best is not None:
+                return self._join(forward, backward, best[1])
+            if len(forward) + len(backward) > max_visited:
+                return None
+
+            if expand_forward:
+                forward_frontier = next_frontier
+            else:
+                backward_frontier = next_frontier
+        return None
+
+    def _join(self, forward: dict, backward: dict, meeting: int) -> list[int]:
+        path = []
+        node = meeting
+        while node != -1:
+            path.append(node)
+            node = forward[node][0]
+        path.reverse()
+        node = backward[meeting][0]
+        while node != -1:
+            path.append(node)
+            node = backward[node][0]
+        return path
+
+class PathSolver:
+    TIME_BUDGET = 0.5 # Seconds per search
+    MAX_VISITED = 2_000_000 # Nodes kept across both search directions
+    REBUILD_INTERVAL = 30 # Minimum seconds between graph rebuilds
+
+    def __init__(self, link_index: LinkIndex, pool: Executor = None):
+        self.link_index = link_index
+        self.pool = pool # Where the graph is built, None builds it on the background thread itself
+        self.graph: LinkGraph|None = None
+        self.lock = threading.Lock()
+        self.building = False
+
+    def current_graph(self) -> LinkGraph|None:
+        # Never builds on the caller, until the first graph is ready there just isn't an answer
+        graph = self.graph
+        if graph is None or (len(self.link_index) != graph.pages and time.monotonic() - graph.built_at > self.REBUILD_INTERVAL):
+            self._rebuild_in_background() # Keep answering from the old graph meanwhile
+        return graph
+
+    def _rebuild_in_background(self):
+        with self.lock:
+            if self.building:
+                return
+            self.building = True
+        threading.Thread(target=self._rebuild, name="path-solver", daemon=True).start()
+
+    def _rebuild(self):
+        started = time.perf_counter()
+        try:
+            self.graph = LinkGraph.from_index(self.link_index, self.pool)
+            log.debug("rebuilt link graph pages=%d edges=%d ms=%.0f", self.graph.pages, len(self.graph.targets), (time.perf_counter() - started) * 1000)
+        except Exception:
+            log.exception("rebuilding link graph failed")
+        finally:
+            with self.lock:
+                self.building = False
+
+    def solve(self, start: str, end: str) -> list[str]|None:
+        graph = self.current_graph()
+        if graph is None:
+            return None
+        source = graph.table.lookup(link_key(start))
+        target = graph.table.lookup(link_key(end))
+        if source is None or target is None:
+            return None
+
+        path = graph.shortest_path(source, target, self.TIME_BUDGET, self.MAX_VISITED)
+        if path is None:
+            return None
+        return [graph.table.key(node) for node in path]
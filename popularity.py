@@ -0,0 +1,148 @@
+import os
+import math
+import json
+import time
+import heapq
+import logging
+import threading
+from pagecache import normalize_key
+
+log = logging.getLogger(__name__)
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from prefetch import Prefetcher
+
+class Popularity:
+    # Exponentially decayed access counts per page. Rather than decaying every entry as time passes, new
+    # hits are weighted up by how long it's been since the epoch and everything is rebased once the
+    # weights get large, so a hit is one dict update. Snapshots survive restarts so a fresh process
+    # knows what to warm.
+    HALF_LIFE = 24 * 60 * 60 # Seconds for a hit to count half as much
+    SNAPSHOT_INTERVAL = 5 * 60
+    MAX_ENTRIES = 20_000 # Pages kept in a snapshot, the long tail isn't worth warming
+    REBASE_WEIGHT = 1e6
+    WARM_RATE = 2 # Pages per second handed to the prefetcher on startup
+    WARM_ROOM = "<startup>" # Prefetch queue the warmup shares its budget through
+    STORE_PATH = "cache/popularity.json"
+
+    def __init__(self, store_path: str|None = STORE_PATH, half_life: float = HALF_LIFE):
+        self.store_path = store_path
+        self.decay = math.log(2) / half_life
+        self.epoch = time.time() # Scores are stored as of this time
+        self.scores: dict[str, float] = {}
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.thread: threading.Thread = None
+        self.snapshots = 0
+        self.warmed = 0
+        if store_path is not None:
+            self.load()
+
+    def _weight(self, now: float) -> float:
+        return math.exp(self.decay * (now - self.epoch))
+
+    def touch(self, key: str):
+        key = normalize_key(key)
+        if key == "":
+            return
+        now = time.time()
+        with self.lock:
+            weight = self._weight(now)
+            if weight > self.REBASE_WEIGHT:
+                self._rebase(now)
+                weight = 1.0
+            self.scores[key] = self.scores.get(key, 0.0) + weight
+
+    def _rebase(self, now: float):
+        # Caller holds the lock
+        factor = 1 / self._weight(now)
+        self.scores = {key: score * factor for key, score in self.scores.items()}
+        self.epoch = now
+
+    def score(self, key: str) -> float:
+        with self.lock:
+            return self.scores.get(normalize_key(key), 0.0) / self._weight(time.time())
+
+    def top(self, count: int) -> list[str]:
+        with self.lock:
+            return heapq.nlargest(count, self.scores, key=self.scores.get)
+
+    def snapshot(self):
+        if self.store_path is None:
+            return
+        now = time.time()
+        with self.lock:
+            weight = self._weight(now)
+            keys = heapq.nlargest(self.MAX_ENTRIES, self.scores, key=self.scores.get)
+            scores = {key: self.scores[key] / weight for key in keys}
+            if len(keys) < len(self.scores):
+                self.scores = {key: self.scores[key] for key in keys}
+
+        directory = os.path.dirname(self.store_path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+        temporary = self.store_path + ".tmp"
+        with open(temporary, "w") as snapshot_file:
+            json.dump({"saved_at": now, "scores": scores}, snapshot_file)
+        os.replace(temporary, self.store_path) # Readers never see a half written snapshot
+        self.snapshots += 1
+
+    def load(self):
+        try:
+            with open(self.store_path, "r") as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            log.warning("ignoring unreadable popularity snapshot path=%s error=%s", self.store_path, e)
+            return
+
+        now = time.time()
+        downtime = math.exp(-self.decay * max(0, now - snapshot["saved_at"])) # Decay keeps going while we're down
+        with self.lock:
+            self.epoch = now
+            self.scores = {key: score * downtime for key, score in snapshot["scores"].items()}
+        log.info("loaded popularity snapshot pages=%d", len(self.scores))
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._snapshot_loop, name="popularity", daemon=True)
+            self.thread.start()
+
+    def _snapshot_loop(self):
+        while not self.stop.wait(self.SNAPSHOT_INTERVAL):
+            try:
+                self.snapshot()
+            except Exception:
+                log.exception("popularity snapshot failed")
+
+    def warm(self, prefetcher: 'Prefetcher', count: int):
+        # Hands the most popular pages to the prefetcher at a steady pace in the background. Prefetches
+        # run at the lowest upstream priority, so players are never kept waiting for the warmup.
+        keys = self.top(count)
+        if len(keys) == 0:
+            return
+
+        def warm_loop():
+            log.info("warming popular pages=%d", len(keys))
+            for key in keys:
+                if self.stop.is_set():
+                    return
+                prefetcher.warm(self.WARM_ROOM, key)
+                self.warmed += 1
+                self.stop.wait(1 / self.WARM_RATE)
+            log.info("finished warming popular pages=%d", len(keys))
+
+        threading.Thread(target=warm_loop, name="popularity-warmup", daemon=True).start()
+
+    def close(self):
+        self.stop.set()
+        self.snapshot()
+
+    def stats(self) -> dict:
+        return {
+            "tracked": len(self.scores),
+            "snapshots": self.snapshots,
+            "warmed": self.warmed
+        }
@@ -0,0 +1,124 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from scheduler import Priority, StaleRequestError, prioritized
+
+log = logging.getLogger(__name__)
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from wiki import WikipediaAPI
+
+class PrefetchTask:
+    def __init__(self, room: str, key: str, sid: str = None, generation: int = 0, follow: bool = False):
+        self.room = room
+        self.key = key
+        self.sid = sid # Player the task was scheduled for, None for room-wide warmups
+        self.generation = generation
+        self.follow = follow # The page a player just opened, its first links are scheduled once it's loaded
+
+class Prefetcher:
+    WORKERS = 4
+    ROOM_BUDGET = 2 # Concurrent prefetches per room
+    ROOM_QUEUE = 32 # Pending prefetches per room before new ones are dropped
+    LINKS_PER_PAGE = 6 # How many of a page's first links are worth warming
+
+    def __init__(self, wikipedia_api: 'WikipediaAPI'):
+        self.wikipedia_api = wikipedia_api
+        self.workers = ThreadPoolExecutor(max_workers=self.WORKERS, thread_name_prefix="prefetch")
+        self.lock = threading.Lock()
+
+        self.queues: dict[str, deque[PrefetchTask]] = {}
+        self.running: dict[str, int] = {}
+        self.scheduled: dict[str, set[str]] = {} # Keys queued or running per room, to avoid duplicate work
+        self.generations: dict[str, int] = {} # Player sid -> current page generation
+
+        self.prefetched = 0
+        self.cancelled = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def warm(self, room: str, key: str):
+        self._schedule(PrefetchTask(room, key))
+
+    def follow(self, room: str, sid: str, key: str):
+        with self.lock:
+            generation = self.generations.get(sid, 0) + 1
+            self.generations[sid] = generation
+        self._schedule(PrefetchTask(room, key, sid, generation, follow=True))
+
+    def forget_player(self, sid: str):
+        with self.lock:
+            self.generations.pop(sid, None)
+
+    def _is_stale(self, task: PrefetchTask) -> bool:
+        return task.sid is not None and self.generations.get(task.sid) != task.generation
+
+    def _schedule(self, task: PrefetchTask):
+        with self.lock:
+            scheduled = self.scheduled.setdefault(task.room, set())
+            queue = self.queues.setdefault(task.room, deque())
+            if not task.follow and task.key in scheduled:
+                return
+            if len(queue) >= self.ROOM_QUEUE:
+                self.dropped += 1
+                return
+            if task.follow:
+                queue.appendleft(task) # Goes before older guesses, its links are what the player clicks next
+            else:
+                scheduled.add(task.key)
+                queue.append(task)
+        self._pump(task.room)
+
+    def _pump(self, room: str):
+        with self.lock:
+            queue = self.queues.get(room)
+            while queue and self.running.get(room, 0) < self.ROOM_BUDGET:
+                task = queue.popleft()
+                if self._is_stale(task):
+                    self.cancelled += 1
+                    if not task.follow:
+                        self.scheduled[room].discard(task.key)
+                    continue
+                self.running[room] = self.running.get(room, 0) + 1
+                self.workers.submit(self._run, task)
+
+            if not queue and self.running.get(room, 0) == 0:
+                self.queues.pop(room, None)
+                self.running.pop(room, None)
+                self.scheduled.pop(room, None)
+
+    def _run(self, task: PrefetchTask):
+        page = None
+        try:
+            if self._is_stale(task):
+                self.cancelled += 1
+            else:
+                with prioritized(Priority.PREFETCH):
+                    page = self.wikipedia_api.render_page(task.key)
+                self.prefetched += 1
+        except StaleRequestError:
+            self.cancelled += 1 # Budget went to players instead, which is the point
+        except Exception as e:
+            self.failed += 1
+            log.debug("prefetch failed key=%s error=%s", task.key, e)
+        finally:
+            with self.lock:
+                self.running[task.room] -= 1
+                if not task.follow:
+                    self.scheduled[task.room].discard(task.key)
+
+        if task.follow and page is not None and not self._is_stale(task):
+            for link in page.links[:self.LINKS_PER_PAGE]:
+                self._schedule(PrefetchTask(task.room, link, task.sid, task.generation))
+        self._pump(task.room)
+
+    def stats(self) -> dict:
+        return {
+            "prefetched": self.prefetched,
+            "cancelled": self.cancelled,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "queued": sum(len(queue) for queue in list(self.queues.values()))
+        }
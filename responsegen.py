@@ -1,14 +1,29 @@
 import gamemanager
+import time
+import logging
+import threading
+import metrics
 from flask_socketio import SocketIO
 from eventtype import EventType
 from flask import request
 from typing import Callable
 
+log = logging.getLogger(__name__)
+
 class ResponseGenerator:
+    TICK = 0.05 # Seconds room updates are coalesced for before being broadcast
+    PROGRESS_TICK = 0.5 # Seconds race progress is coalesced for, one snapshot per room no matter how many clicks
+
     def __init__(self, gamemanager: gamemanager.GameManager, socketio: SocketIO):
         self.gamemanager = gamemanager
         self.socketio = socketio
 
+        self.dirty_rooms: set[str] = set() # Rooms with changes waiting for the next tick
+        self.progress_rooms: set[str] = set() # Racing rooms with moves waiting for the next progress tick
+        self.dirty_lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.flusher_started = False
+
     def emit(self, event: EventType|gamemanager.GameModeResponse|str, generator: Callable, target: str = None, **args):
 
         if target == None:
@@ -16,29 +31,112 @@ class ResponseGenerator:
 
         if type(event) in (EventType, gamemanager.GameModeResponse):
             event = event.value
-            print("Resolved event: " + event)
 
-        self.socketio.emit(
-            event,
-            generator(**args),
-            to=target
-        )
+        self._send(event, generator(**args), target)
+
+    def _send(self, event: str, data: dict, target: str):
+        self.socketio.emit(event, data, to=target)
+        # Fan-out as seen by this worker, sockets on other workers get it through the message queue
+        recipients = self.socketio.server.manager.rooms.get("/", {}).get(target, ())
+        metrics.emit_fanout.observe(len(recipients), event=event)
+
+
+    def emit_room_update(self, room: str, player: str = None, immediate: bool = False):
+        if player is not None:
+            # Full snapshot for a single client (joins and resyncs)
+            return self._send(EventType.ROOM_UPDATE.value, self.room_snapshot(room, player), player)
+
+        room_object = self._get_room_object(room)
+        room_object.update_state() # State transitions can't wait for the tick, only the broadcast can
+
+        if immediate:
+            return self.flush_room(room_object)
 
+        with self.dirty_lock:
+            self.dirty_rooms.add(room_object.name)
+            self._start_flusher()
 
-    def emit_room_update(self, room: str, player: str = None):
-        self.socketio.emit(
-            EventType.ROOM_UPDATE.value,
-            self.room_info(room, player),
-            to=player if player is not None else room
-        )
+    def emit_resume(self, player: gamemanager.Player):
+        # Puts a resumed client back where its player is, in one go rather than replaying what it missed
+        self._send(EventType.SESSION.value, self.success(token=player.resume_token(), resumed=True), player.sid)
+        room = player.room
+        if room is None:
+            return
+        self._send(EventType.JOIN_ROOM_RESPONSE.value, self.room_snapshot(room, player), player.sid)
+        self.emit_room_update(room.name)
+        if not room.is_playing():
+            return
+        if not player.spectating:
+            page_id = player.history.current_key() or room.settings.start_article.page_id
+            self._send(gamemanager.GameModeResponse.START.value, self.start("wikiWindow", page_id), player.sid)
+        self.flush_progress(room, player.sid)
 
-    def emit_error_response(self, event: EventType, error: gamemanager.GameManagerError):
+    def emit_progress(self, room: str):
+        with self.dirty_lock:
+            self.progress_rooms.add(room)
+            self._start_flusher()
 
-        self.socketio.emit(
-            event.value,
-            self.error(error),
-            to=request.sid
-        )
+    def _start_flusher(self):
+        # Caller holds dirty_lock
+        if not self.flusher_started:
+            self.flusher_started = True
+            self.socketio.start_background_task(self._flush_loop)
+
+    def _flush_loop(self):
+        progress_due = time.monotonic() + self.PROGRESS_TICK
+        while True:
+            self.socketio.sleep(self.TICK)
+            progress = set()
+            with self.dirty_lock:
+                rooms = self.dirty_rooms
+                self.dirty_rooms = set()
+                if time.monotonic() >= progress_due:
+                    progress = self.progress_rooms
+                    self.progress_rooms = set()
+                    progress_due = time.monotonic() + self.PROGRESS_TICK
+            for room in rooms:
+                self._flush(room, self.flush_room)
+            for room in progress:
+                self._flush(room, self.flush_progress)
+
+    def _flush(self, room: str, flush: Callable):
+        try:
+            with self.gamemanager.session():
+                flush(self.gamemanager.get_room(room))
+        except gamemanager.RoomDoesNotExistException:
+            pass # Destroyed before the tick came around
+        except Exception:
+            log.exception("room update failed room=%s", room)
+
+    def flush_progress(self, room: gamemanager.Room, target: str = None):
+        if not room.is_playing():
+            return # The victory broadcast already has the final standings
+        self._send(EventType.RACE_PROGRESS.value, self.race_progress(room), target if target is not None else room.name)
+
+    def flush_room(self, room: gamemanager.Room):
+        with self.flush_lock:
+            info = self.room_info(room)
+            changes = {key: value for key, value in info.items() if room.broadcast_state.get(key) != value}
+            if len(changes) == 0:
+                return
+            room.version += 1
+            room.broadcast_state = info
+            update = {"status": "success", "version": room.version, "full": False, "changes": changes}
+
+        self._send(EventType.ROOM_UPDATE.value, update, room.name)
+
+    def room_snapshot(self, room: gamemanager.Room|str, player: gamemanager.Player|str = None, status: str = "success"):
+        # Broadcast pending changes first so the snapshot and the version it carries match what the room has seen
+        room = self._get_room_object(room)
+        self.flush_room(room)
+        response = self.room_info(room, player, status)
+        response["version"] = room.version
+        response["full"] = True
+        return response
+
+    def emit_error_response(self, event: EventType, error: gamemanager.GameManagerError, target: str = None):
+
+        self._send(event.value, self.error(error), target if target is not None else request.sid)
         
 
     def _get_player_object(self, player: gamemanager.Player|str) -> gamemanager.Player:
@@ -65,20 +163,17 @@ class ResponseGenerator:
         response["code"] = room.code
         response["requires_code"] = room.requires_code
         response["players"] = self._create_player_list(room.players)
+        response["spectators"] = self._create_player_list(room.spectators)
         response["owner"] = room.owner.name
         response["mode"] = room.settings.mode.name
         response["start_article"] = room.settings.get_member_or("start_article").serialize()
         response["end_article"] = room.settings.get_member_or("end_article").serialize()
-        response["waiting_for_players"] = room.evaluate_waiting_for_reset()
-        
-
-        if room.state == gamemanager.RoomState.WAITING and not response["waiting_for_players"]:
-            room.state = gamemanager.RoomState.IN_ROOM_SETTINGS
-
+        response["waiting_for_players"] = room.update_state()
         response["state"] = room.state.value
         
         if player:
             response["username"] = player.name
+            response["spectating"] = player.spectating
         
         return response
     
@@ -117,6 +212,29 @@ class ResponseGenerator:
         response["status"] = status
         return response
     
+    def race_progress(self, room: gamemanager.Room, status: str = "success"):
+        # Everyone's standing in one message, elapsed times are server side so clients can't disagree
+        now = time.time()
+        response = {}
+        response["status"] = status
+        response["elapsed"] = round(now - room.started_at, 1)
+        response["players"] = [{
+            "name": player.name,
+            "clicks": player.clicks,
+            "page": player.get_current_title(),
+            "moved_at": round(player.moved_at - room.started_at, 1) if player.moved_at is not None else None
+        } for player in room.players]
+        response["spectators"] = len(room.spectators)
+        return response
+
+    def suggestions(self, query: str, element: str, suggestions: list[dict], status: str = "success"):
+        response = {}
+        response["query"] = query
+        response["element"] = element
+        response["suggestions"] = suggestions
+        response["status"] = status
+        return response
+
     def chat_message(self, sender: str, message: str, status: str = "success"):
         response = {}
         response["sender"] = sender
@@ -0,0 +1,160 @@
+import time
+import heapq
+import itertools
+import metrics
+import threading
+from enum import IntEnum
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+class Priority(IntEnum):
+    NAVIGATION = 0 # Validating a click, a player is staring at a spinner
+    CONTENT = 1 # Serving an article someone asked for
+    SEARCH = 2 # Host searches and autocomplete
+    PREFETCH = 3 # Background warming, only worth doing with spare budget
+
+# Seconds a request may wait for budget before it's dropped, None waits as long as it takes
+MAX_WAIT = {
+    Priority.NAVIGATION: None,
+    Priority.CONTENT: 10,
+    Priority.SEARCH: 3,
+    Priority.PREFETCH: 2
+}
+
+# Priority of upstream requests made from the current thread, greenlet or task
+current_priority: ContextVar[Priority] = ContextVar("priority", default=Priority.CONTENT)
+
+@contextmanager
+def prioritized(priority: Priority):
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+class StaleRequestError(Exception):
+    pass
+
+class Ticket:
+    __slots__ = ("priority", "enqueued_at", "deadline", "cancelled")
+
+    def __init__(self, priority: Priority, now: float):
+        self.priority = priority
+        self.enqueued_at = now
+        max_wait = MAX_WAIT[priority]
+        self.deadline = now + max_wait if max_wait is not None else None
+        self.cancelled = False
+
+class PriorityStats:
+    __slots__ = ("queued", "granted", "dropped", "wait_total", "wait_max")
+
+    def __init__(self):
+        self.queued = 0
+        self.granted = 0
+        self.dropped = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+class RequestScheduler:
+    # Every upstream request waits here for a token from one global bucket. Waiters are served strictly
+    # by priority, so prefetches and searches only ever use budget navigation and content didn't need.
+    RATE = 10 # Requests per second
+    BURST = 20
+
+    def __init__(self, rate: float = None, burst: float = None):
+        self.rate = rate if rate is not None else self.RATE
+        self.burst = burst if burst is not None else self.BURST
+        self.tokens = self.burst
+        self.refilled_at = time.monotonic()
+
+        self.condition = threading.Condition()
+        self.heap: list[tuple[int, int, Ticket]] = []
+        self.sequence = itertools.count()
+        self.waiting: dict[object, Ticket] = {} # Request key -> ticket, so a coalesced caller can raise its priority
+        self.stats_by_priority = {priority: PriorityStats() for priority in Priority}
+
+    def acquire(self, key=None):
+        with self.condition:
+            now = time.monotonic()
+            ticket = Ticket(current_priority.get(), now)
+            self._push(ticket)
+            if key is not None:
+                self.waiting[key] = ticket
+            self.stats_by_priority[ticket.priority].queued += 1
+
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    head = self._head()
+                    if head is ticket and self.tokens >= 1:
+                        heapq.heappop(self.heap)
+                        self.tokens -= 1
+                        self.condition.notify_all() # The next waiter may be able to go too
+                        break
+
+                    if ticket.deadline is not None and now >= ticket.deadline:
+                        ticket.cancelled = True
+                        self.stats_by_priority[ticket.priority].dropped += 1
+                        self.condition.notify_all()
+                        raise StaleRequestError("Waited too long for upstream budget")
+
+                    timeout = (1 - self.tokens) / self.rate if self.tokens < 1 else None
+                    if ticket.deadline is not None:
+                        timeout = min(timeout, ticket.deadline - now) if timeout is not None else ticket.deadline - now
+                    self.condition.wait(timeout)
+            finally:
+                stats = self.stats_by_priority[ticket.priority]
+                stats.queued -= 1
+                if key is not None and self.waiting.get(key) is ticket:
+                    del self.waiting[key]
+
+            wait = time.monotonic() - ticket.enqueued_at
+            stats.granted += 1
+            stats.wait_total += wait
+            stats.wait_max = max(stats.wait_max, wait)
+        metrics.upstream_wait_seconds.observe(wait, priority=ticket.priority.name.lower())
+
+    def boost(self, key):
+        # Someone more important now needs the result of a request already waiting at lower priority
+        priority = current_priority.get()
+        with self.condition:
+            ticket = self.waiting.get(key)
+            if ticket is None or ticket.priority <= priority:
+                return
+            self.stats_by_priority[ticket.priority].queued -= 1
+            self.stats_by_priority[priority].queued += 1
+            ticket.priority = priority
+            max_wait = MAX_WAIT[priority]
+            ticket.deadline = ticket.enqueued_at + max_wait if max_wait is not None else None
+            self._push(ticket) # The old heap entry is skipped once its priority no longer matches
+            self.condition.notify_all()
+
+    def _push(self, ticket: Ticket):
+        heapq.heappush(self.heap, (ticket.priority, next(self.sequence), ticket))
+
+    def _head(self) -> Ticket|None:
+        # Drop entries for tickets that gave up or were re-queued at another priority
+        while self.heap:
+            priority, _, ticket = self.heap[0]
+            if ticket.cancelled or priority != ticket.priority:
+                heapq.heappop(self.heap)
+                continue
+            return ticket
+        return None
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+    def stats(self) -> dict:
+        stats = {}
+        for priority, priority_stats in self.stats_by_priority.items():
+            stats[priority.name.lower()] = {
+                "queued": priority_stats.queued,
+                "granted": priority_stats.granted,
+                "dropped": priority_stats.dropped,
+                "wait_avg_ms": round(priority_stats.wait_total / priority_stats.granted * 1000, 1) if priority_stats.granted > 0 else 0,
+                "wait_max_ms": round(priority_stats.wait_max * 1000, 1)
+            }
+        return stats
@@ -0,0 +1,99 @@
+# Production entry point. Runs the app on gevent so one process can hold thousands of WebSockets
+# instead of one OS thread per connection. Monkey patching has to happen before anything imports
+# socket, ssl or threading.
+from gevent import monkey
+monkey.patch_all()
+
+import os
+import sys
+import time
+import logging
+import signal
+import subprocess
+import dotenv
+import gevent
+from gevent.pool import Pool
+from gevent.pywsgi import WSGIServer
+
+try:
+    from geventwebsocket.handler import WebSocketHandler
+except ImportError:
+    WebSocketHandler = None # python-engineio falls back to simple-websocket
+
+dotenv.load_dotenv()
+
+log = logging.getLogger("serve")
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", 5000))
+WORKERS = int(os.getenv("WORKERS", 1))
+MAX_CONNECTIONS = int(os.getenv("MAX_CONNECTIONS", 5000)) # Socket.IO sessions per worker
+HTTP_HEADROOM = 256 # Extra greenlets for page requests and polling on top of open sockets
+DRAIN_TIMEOUT = int(os.getenv("DRAIN_TIMEOUT", 60)) # Seconds running races get to finish on shutdown
+DRAIN_POLL = 1
+STOP_TIMEOUT = 5
+
+def supervise():
+    # Each worker gets its own port so a load balancer can keep every client on the worker holding its
+    # session, broadcasts between workers go through MESSAGE_QUEUE and shared state through STATE_BACKEND
+    if not os.getenv("MESSAGE_QUEUE") or os.getenv("STATE_BACKEND", "memory") != "redis":
+        sys.exit("Running more than one worker needs MESSAGE_QUEUE and STATE_BACKEND=redis")
+
+    workers = []
+    for index in range(WORKERS):
+        environment = dict(os.environ, WORKER_INDEX=str(index), PORT=str(PORT + index))
+        workers.append(subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=environment))
+
+    def stop():
+        for worker in workers:
+            if worker.poll() is None:
+                worker.send_signal(signal.SIGTERM)
+
+    gevent.signal_handler(signal.SIGTERM, stop)
+    gevent.signal_handler(signal.SIGINT, stop)
+    for worker in workers:
+        worker.wait()
+
+def drain(server: WSGIServer, main):
+    log.info("draining, no longer accepting new connections")
+    main.connection_gate.drain()
+    # Lobbies and finished rooms go right away, racers are let go as their race ends
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    racing = main.disconnect_idle_sessions()
+    while racing > 0 and time.monotonic() < deadline:
+        gevent.sleep(DRAIN_POLL)
+        racing = main.disconnect_idle_sessions()
+
+    main.pair_pool.close()
+    main.wikipedia.transformer.close()
+    main.game_history.close()
+    main.wikipedia.popularity.close()
+    if main.state_snapshot is not None:
+        main.state_snapshot.close() # Whoever is still connected gets to resume on the next process
+    server.stop(timeout=STOP_TIMEOUT)
+    log.info("stopped with connections=%d still open", main.connection_gate.open_count())
+
+def serve():
+    os.environ.setdefault("ASYNC_MODE", "gevent")
+    os.environ.setdefault("MAX_CONNECTIONS", str(MAX_CONNECTIONS))
+    import main
+
+    options = {
+        "spawn": Pool(MAX_CONNECTIONS + HTTP_HEADROOM), # A full pool stops accepting, the kernel backlog absorbs bursts
+        "log": logging.getLogger("access"), # Access lines are logged at DEBUG
+        "error_log": log
+    }
+    if WebSocketHandler is not None:
+        options["handler_class"] = WebSocketHandler
+    server = WSGIServer((HOST, PORT), main.app, **options)
+
+    gevent.signal_handler(signal.SIGTERM, lambda: gevent.spawn(drain, server, main))
+    gevent.signal_handler(signal.SIGINT, lambda: gevent.spawn(drain, server, main))
+    log.info("serving on %s:%d max_connections=%d", HOST, PORT, MAX_CONNECTIONS)
+    server.serve_forever()
+
+if __name__ == "__main__":
+    if WORKERS > 1 and os.getenv("WORKER_INDEX") is None:
+        supervise()
+    else:
+        serve()
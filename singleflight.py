@@ -0,0 +1,43 @@
+import threading
+
+class Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException = None
+
+class Singleflight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: dict[object, Call] = {}
+        self.coalesced = 0 # Calls that piggybacked on one already in flight
+
+    def do(self, key, function, *args):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = Call()
+                self.calls[key] = call
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args)
+            return call.result
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        return len(self.calls)
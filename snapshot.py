@@ -0,0 +1,108 @@
+import os
+import gzip
+import json
+import time
+import logging
+import threading
+from gamemanager import GameManager, Player, Room
+from wiki import WikipediaAPI
+
+log = logging.getLogger(__name__)
+
+class StateSnapshot:
+    # Every room and everyone in it, written to disk periodically and on shutdown and read back on boot.
+    # Restored players come back detached, their clients resume them with the token they were given, so
+    # a restart costs each client one reconnect instead of rebuilding its room from scratch.
+    # Only used with the in-memory state backend, Redis already outlives the process.
+    STORE_PATH = "cache/state.json.gz"
+    INTERVAL = 30 # Seconds between snapshots, which is also about how much a crash can lose
+    MAX_AGE = 10 * 60 # Older snapshots are from a server that was down too long for anyone to still be waiting
+    RESUME_WINDOW = 2 * 60 # Seconds restored players have to come back before their seat is given up
+    FORMAT = 1
+
+    def __init__(self, game_manager: GameManager, api: WikipediaAPI, path: str = STORE_PATH):
+        self.game_manager = game_manager
+        self.api = api
+        self.path = path
+        self.stop = threading.Event()
+        self.thread: threading.Thread = None
+        self.saved = 0
+
+    def save(self) -> int:
+        started = time.perf_counter()
+        rooms = []
+        players = []
+        with self.game_manager.session():
+            for name in self.game_manager.room_names():
+                room = self.game_manager.state.fetch_room(name)
+                if room is None:
+                    continue
+                rooms.append(room.to_record())
+                players.extend(player.to_record() for player in room.players + room.spectators)
+
+        directory = os.path.dirname(self.path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+        data = json.dumps({"format": self.FORMAT, "saved_at": time.time(), "rooms": rooms, "players": players}, separators=(",", ":"))
+        temporary = self.path + ".tmp"
+        with gzip.open(temporary, "wt", encoding="utf-8", compresslevel=6) as snapshot_file:
+            snapshot_file.write(data)
+        os.replace(temporary, self.path) # A crash mid write leaves the previous snapshot in place
+        self.saved += 1
+        log.debug("saved state snapshot rooms=%d players=%d ms=%.0f", len(rooms), len(players), (time.perf_counter() - started) * 1000)
+        return len(rooms)
+
+    def restore(self) -> int:
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            log.warning("ignoring unreadable state snapshot path=%s error=%s", self.path, e)
+            return 0
+
+        age = time.time() - snapshot["saved_at"]
+        if snapshot["format"] != self.FORMAT or age > self.MAX_AGE:
+            log.info("ignoring stale state snapshot age=%.0fs", age)
+            return 0
+
+        players: dict[str, Player] = {}
+        for record in snapshot["players"]:
+            player = Player(record["sid"])
+            player.load_record(record)
+            players[player.sid] = player
+
+        state = self.game_manager.state
+        with self.game_manager.session():
+            for record in snapshot["rooms"]:
+                if not state.claim_room(record["name"]):
+                    continue
+                room = Room(record["name"], record["code"], self.api)
+                room.load_record(record, players)
+                for player in room.players + room.spectators:
+                    player.room = room
+                    state.save_player(player)
+                state.save_room(room)
+            for sid, player in players.items():
+                if player.room is not None:
+                    self.game_manager.detach_player(sid, self.RESUME_WINDOW) # Nobody's socket survived the restart
+
+        log.info("restored state snapshot rooms=%d players=%d age=%.0fs", len(snapshot["rooms"]), len(players), age)
+        return len(snapshot["rooms"])
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._save_loop, name="state-snapshot", daemon=True)
+            self.thread.start()
+
+    def _save_loop(self):
+        while not self.stop.wait(self.INTERVAL):
+            try:
+                self.save()
+            except Exception:
+                log.exception("state snapshot failed")
+
+    def close(self):
+        self.stop.set()
+        self.save()
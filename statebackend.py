@@ -0,0 +1,320 @@
+import json
+import logging
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from gamemanager import Player, Room
+    from wiki import WikipediaAPI
+
+log = logging.getLogger(__name__)
+
+class StateBackend(ABC):
+    # Where GameManager keeps its players and rooms. Socket handlers run inside session() so shared
+    # backends can load what the event touches and write it back once the event is done.
+
+    @contextmanager
+    def session(self):
+        yield
+
+    @abstractmethod
+    def fetch_player(self, sid: str) -> 'Player|None':
+        pass
+
+    @abstractmethod
+    def fetch_room(self, name: str) -> 'Room|None':
+        pass
+
+    @abstractmethod
+    def save_player(self, player: 'Player'):
+        pass
+
+    @abstractmethod
+    def save_room(self, room: 'Room'):
+        pass
+
+    @abstractmethod
+    def delete_player(self, sid: str) -> bool:
+        pass
+
+    @abstractmethod
+    def delete_room(self, name: str) -> bool:
+        pass
+
+    @abstractmethod
+    def claim_room(self, name: str) -> bool:
+        pass
+
+    @abstractmethod
+    def room_names(self) -> list[str]:
+        pass
+
+    @abstractmethod
+    def player_count(self) -> int:
+        pass
+
+    @abstractmethod
+    def resident(self) -> tuple[list['Player'], list['Room']]:
+        # Players and rooms this process holds on to between events
+        pass
+
+    # Deadlines of detached players live next to the players themselves, so whoever sweeps next expires
+    # them even if the worker that detached them is gone
+    @abstractmethod
+    def hold_player(self, sid: str, deadline: float):
+        pass
+
+    @abstractmethod
+    def release_player(self, sid: str):
+        pass
+
+    @abstractmethod
+    def claim_expired_players(self, now: float) -> list[str]:
+        # Each sid is handed to exactly one caller
+        pass
+
+    @abstractmethod
+    def held_count(self) -> int:
+        pass
+
+class InMemoryStateBackend(StateBackend):
+    def __init__(self):
+        self.players: dict[str, 'Player'] = {}
+        self.rooms: dict[str, 'Room'] = {}
+        self.held: dict[str, float] = {} # Sid -> deadline
+
+    def fetch_player(self, sid: str) -> 'Player|None':
+        return self.players.get(sid)
+
+    def fetch_room(self, name: str) -> 'Room|None':
+        return self.rooms.get(name)
+
+    def save_player(self, player: 'Player'):
+        self.players[player.sid] = player
+
+    def save_room(self, room: 'Room'):
+        self.rooms[room.name] = room
+
+    def delete_player(self, sid: str) -> bool:
+        return self.players.pop(sid, None) is not None
+
+    def delete_room(self, name: str) -> bool:
+        return self.rooms.pop(name, None) is not None
+
+    def claim_room(self, name: str) -> bool:
+        return name not in self.rooms
+
+    def room_names(self) -> list[str]:
+        return list(self.rooms.keys())
+
+    def player_count(self) -> int:
+        return len(self.players)
+
+    def resident(self) -> tuple[list['Player'], list['Room']]:
+        return list(self.players.values()), list(self.rooms.values())
+
+    def hold_player(self, sid: str, deadline: float):
+        self.held[sid] = deadline
+
+    def release_player(self, sid: str):
+        self.held.pop(sid, None)
+
+    def claim_expired_players(self, now: float) -> list[str]:
+        expired = [sid for sid, deadline in list(self.held.items()) if deadline <= now]
+        return [sid for sid in expired if self.held.pop(sid, None) is not None]
+
+    def held_count(self) -> int:
+        return len(self.held)
+
+class RedisStateBackend(StateBackend):
+    # Rooms and players live in Redis as JSON records so any worker can serve any room. Each session
+    # loads its own objects, one per sid/room name, so identity comparisons work within an event and no
+    # event ever sees another one's half loaded room.
+    # Room locks are only ever waited for in name order. A room that sorts before one already held is
+    # tried once, and if it's taken the event fails instead of risking a deadlock with its mirror image.
+    PREFIX = "wikispeedrun:"
+    LOCK_TIMEOUT = 10 # Seconds before a crashed worker's room lock expires
+    LOCK_WAIT = 3 # Seconds an event waits for a room lock before giving up
+
+    def __init__(self, url: str, api: 'WikipediaAPI'):
+        if redis is None:
+            raise RuntimeError("The redis package is required for the redis state backend")
+        self.redis = redis.Redis.from_url(url)
+        self.api = api
+        self.local = threading.local()
+
+    def _key(self, kind: str, name: str) -> str:
+        return self.PREFIX + kind + ":" + name
+
+    @contextmanager
+    def session(self):
+        if getattr(self.local, "depth", 0) > 0:
+            self.local.depth += 1
+            try:
+                yield
+            finally:
+                self.local.depth -= 1
+            return
+
+        self.local.depth = 1
+        self.local.players = {}
+        self.local.rooms = {}
+        self.local.locks = {}
+        self.local.failed = False # A lock couldn't be had, whatever the event changed is thrown away
+        try:
+            yield
+            if not self.local.failed:
+                self._commit()
+        finally:
+            for lock in self.local.locks.values():
+                try:
+                    lock.release()
+                except redis.exceptions.LockError:
+                    pass # Expired under us, the commit already happened or was lost
+            self.local.depth = 0
+
+    def _in_session(self) -> bool:
+        return getattr(self.local, "depth", 0) > 0
+
+    def _commit(self):
+        if not all(lock.owned() for lock in self.local.locks.values()):
+            log.warning("room lock expired before commit, dropping changes rooms=%s", sorted(self.local.locks))
+            return
+        pipeline = self.redis.pipeline()
+        for sid, player in self.local.players.items():
+            if player is not None:
+                pipeline.set(self._key("player", sid), json.dumps(player.to_record()))
+        for name, room in self.local.rooms.items():
+            if room is not None:
+                pipeline.set(self._key("room", name), json.dumps(room.to_record()))
+        pipeline.execute()
+
+    def _lock_room(self, name: str):
+        if self._in_session() and name not in self.local.locks:
+            from gamemanager import RoomBusyException
+            lock = self.redis.lock(self._key("lock", name), timeout=self.LOCK_TIMEOUT)
+            if any(held > name for held in self.local.locks):
+                acquired = lock.acquire(blocking=False) # Out of order, waiting here could deadlock
+            else:
+                acquired = lock.acquire(blocking=True, blocking_timeout=self.LOCK_WAIT)
+            if not acquired:
+                self.local.failed = True
+                raise RoomBusyException("Locking room " + name)
+            self.local.locks[name] = lock
+
+    def _touch_player(self, player: 'Player'):
+        if self._in_session():
+            self.local.players[player.sid] = player
+
+    def _touch_room(self, room: 'Room'):
+        if self._in_session():
+            self.local.rooms[room.name] = room
+
+    def _load_player(self, record: dict) -> 'Player':
+        from gamemanager import Player
+        if self._in_session():
+            player = self.local.players.get(record["sid"])
+            if player is not None:
+                return player # Already loaded by this event, which may have changed it since
+        player = Player(record["sid"])
+        player.load_record(record)
+        return player
+
+    def fetch_player(self, sid: str) -> 'Player|None':
+        if self._in_session() and sid in self.local.players:
+            return self.local.players[sid]
+
+        data = self.redis.get(self._key("player", sid))
+        if data is None:
+            return None
+
+        record = json.loads(data)
+        player = self._load_player(record)
+        player.room = None
+        self._touch_player(player)
+        if record["room"] is not None:
+            self.fetch_room(record["room"]) # Sets player.room
+        return player
+
+    def fetch_room(self, name: str) -> 'Room|None':
+        from gamemanager import Room
+        if self._in_session() and name in self.local.rooms:
+            return self.local.rooms[name]
+
+        self._lock_room(name)
+        data = self.redis.get(self._key("room", name))
+        if data is None:
+            return None
+
+        record = json.loads(data)
+        room = Room(record["name"], record["code"], self.api)
+
+        players = {}
+        sids = record["players"] + record["spectators"]
+        if len(sids) > 0:
+            for player_data in self.redis.mget([self._key("player", sid) for sid in sids]):
+                if player_data is not None:
+                    player = self._load_player(json.loads(player_data))
+                    player.room = room
+                    players[player.sid] = player
+                    self._touch_player(player)
+
+        room.load_record(record, players)
+        self._touch_room(room)
+        return room
+
+    def save_player(self, player: 'Player'):
+        self.redis.set(self._key("player", player.sid), json.dumps(player.to_record()))
+        self._touch_player(player)
+
+    def save_room(self, room: 'Room'):
+        self._lock_room(room.name)
+        self.redis.set(self._key("room", room.name), json.dumps(room.to_record()))
+        self._touch_room(room)
+
+    def delete_player(self, sid: str) -> bool:
+        if self._in_session():
+            self.local.players[sid] = None
+        return self.redis.delete(self._key("player", sid)) > 0
+
+    def delete_room(self, name: str) -> bool:
+        if self._in_session():
+            self.local.rooms[name] = None
+        pipeline = self.redis.pipeline()
+        pipeline.delete(self._key("room", name))
+        pipeline.srem(self._key("index", "rooms"), name)
+        deleted, _ = pipeline.execute()
+        return deleted > 0
+
+    def claim_room(self, name: str) -> bool:
+        return self.redis.sadd(self._key("index", "rooms"), name) == 1
+
+    def room_names(self) -> list[str]:
+        return [name.decode("utf-8") for name in self.redis.smembers(self._key("index", "rooms"))]
+
+    def player_count(self) -> int:
+        return sum(1 for _ in self.redis.scan_iter(self._key("player", "*"), count=1000))
+
+    def resident(self) -> tuple[list['Player'], list['Room']]:
+        return [], [] # Nothing outlives its session, Redis holds the real copies
+
+    def hold_player(self, sid: str, deadline: float):
+        self.redis.zadd(self._key("index", "held"), {sid: deadline})
+
+    def release_player(self, sid: str):
+        self.redis.zrem(self._key("index", "held"), sid)
+
+    def claim_expired_players(self, now: float) -> list[str]:
+        key = self._key("index", "held")
+        expired = [sid.decode("utf-8") for sid in self.redis.zrangebyscore(key, "-inf", now)]
+        return [sid for sid in expired if self.redis.zrem(key, sid) == 1] # Only one worker's ZREM wins
+
+    def held_count(self) -> int:
+        return self.redis.zcard(self._key("index", "held"))
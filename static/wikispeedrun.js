@@ -13,17 +13,35 @@ const chatMessageDisplay = document.getElementById("chat-message-area");
 
 const startPageSearch = document.getElementById("start-page-input");
 const endPageSearch = document.getElementById("end-page-input");
+const pageSuggestions = {
+    "start_article": document.getElementById("start-page-suggestions"),
+    "end_article": document.getElementById("end-page-suggestions")
+};
+const randomDifficulty = document.getElementById("random-difficulty");
+const randomPairButton = document.getElementById("random-pair");
 
 const pageRender = document.getElementById("page-render");
 
 const winnerName = document.getElementById("winner-name");
 const victoryStatPagePath = document.getElementById("page-path");
+const victoryOptimalSummary = document.getElementById("optimal-summary");
+const victoryOptimalPath = document.getElementById("optimal-path");
+const victoryAbandonedSummary = document.getElementById("abandoned-summary");
+const victoryAbandonedBranches = document.getElementById("abandoned-branches");
+
+const raceProgress = document.getElementById("race-progress");
+const spectateRoomName = document.getElementById("spectate-room-name");
+const spectateElapsed = document.getElementById("spectate-elapsed");
+const spectateProgress = document.getElementById("spectate-progress");
 
 const urlBar = document.getElementById("url-bar");
 
 /* Misc Constants */
 const notificationTimeout = 5000;
 const connectTimeout = 10000;
+const autocompleteDelay = 150;
+const pageCacheSize = 32; // Pages kept in memory so back and forward don't fetch them again
+const sessionTokenKey = "wikispeedrun-session"; // Per tab, so a reload or a server restart resumes the same player
 const youText = "YOU 👉"
 const ownerText = "OWNER 👉"
 const url = "https://en.wikipedia.org/wiki/"
@@ -96,16 +114,21 @@ function linkPostProcess(targetElement, targetFunction) {
 var hadConnectedToServer = false;
 var currentNotificationTimeout = null;
 var currentConnectionTimeout = null;
+var currentAutocompleteTimeout = null;
 var sceneBeforeLoading = null;
 var inGame = false;
+var raceClock = null; // Ticks the elapsed time between progress updates
 
 /* Player Definition */
 var localPlayer = {
     name: null,
-    room: null
+    room: null,
+    spectating: false
 }
 
 /* Room Definitions */
+var pageCache = new Map(); // page_id -> {html, title}, oldest first
+var roomState = null; // Last full room snapshot with every delta since applied
 var roomData = {
     startPage: null,
     endPage: null,
@@ -118,6 +141,7 @@ const scenes = {
     roomSettings: "room-settings",
     wikiWindow: "wiki-window",
     victory: "victory-dialog",
+    spectate: "spectate-window",
     connectFailed: "connect-failed"
 }
 
@@ -126,10 +150,27 @@ const socket = io({
     closeOnBeforeunload: true
 });
 socket.on('connect', function() {
-    setScene("room");
+    socket.emit("client_connect", {"token": sessionStorage.getItem(sessionTokenKey)});
+});
+socket.on('session', function(data) {
+    sessionStorage.setItem(sessionTokenKey, data["token"]);
     if (hadConnectedToServer) sendNotification("Reconnected to the server");
-    socket.emit("client_connect");
     hadConnectedToServer = true;
+    roomState = null; // A new session starts from the snapshot the server sends, never from what we had
+    if (data["resumed"]) return; // The server follows up with the room (and race) we were in
+    localPlayer.room = null;
+    localPlayer.spectating = false;
+    setScene("room");
+});
+socket.on('connect_error', function(error) {
+    if (socket.active) return; // Network trouble, socket.io is already retrying
+    if (error.message == "banned") {
+        showBanned();
+        return;
+    }
+    // The server turned us away because it's full or shutting down, back off before trying again
+    setLoading("The server is busy, retrying...");
+    setTimeout(() => socket.connect(), 2000 + Math.random() * 3000);
 });
 socket.on('disconnect', function() {
     console.log("Disconnected from server");
@@ -185,6 +226,26 @@ function searchEndPage() {
 function searchPage(query, element) {
     socket.emit("search_pages", {"query": query, "element": element});
 }
+function autocompletePage(query, element) {
+    if (currentAutocompleteTimeout != null) clearTimeout(currentAutocompleteTimeout);
+    currentAutocompleteTimeout = setTimeout(() => {
+        socket.emit("autocomplete", {"query": query, "element": element});
+    }, autocompleteDelay);
+}
+function showSuggestions(data) {
+    let list = pageSuggestions[data["element"]];
+    if (list == undefined) return;
+    list.innerHTML = "";
+    data["suggestions"].forEach(suggestion => {
+        let option = document.createElement("option");
+        option.value = suggestion["title"];
+        option.label = suggestion["description"];
+        list.appendChild(option);
+    });
+}
+function randomPair() {
+    socket.emit("random_pair", {"difficulty": randomDifficulty.value});
+}
 function startGame() {
     socket.emit("try_start_game");
     setLoading("Starting game...");
@@ -198,7 +259,7 @@ function navigateForward() {
 function loadPage(content) {
     console.log("Rendering new page");
     var doc = pageRender.contentWindow.document;
-    doc.write(content.replaceAll("&#183;", "•"));
+    doc.write(content.replaceAll("·", "•"));
 
     
     
@@ -216,12 +277,19 @@ function loadPage(content) {
 /* Room Creation Events */
 function createRoom() {
     setLoading("Creating room...");
+    roomState = null;
     socket.emit("try_create_room", {"room": roomIDInput.value, "code": roomCodeInput.value})
 }
 function joinRoom() {
     setLoading("Joining room...");
+    roomState = null; // Deltas only apply on top of the new room's snapshot
     socket.emit("try_join_room", {"room": roomIDInput.value, "code": roomCodeInput.value});
 }
+function spectateRoom() {
+    setLoading("Joining room...");
+    roomState = null;
+    socket.emit("try_spectate_room", {"room": roomIDInput.value, "code": roomCodeInput.value});
+}
 
 /* Misc Room Callbacks */
 function leaveRoom() {
@@ -316,14 +384,24 @@ function updateRoomSettings(data) {
     if (localPlayer.name == data["owner"]) {
         startPageSearch.disabled = false;
         endPageSearch.disabled = false;
+        randomDifficulty.disabled = false;
+        randomPairButton.disabled = false;
     } else {
         startPageSearch.disabled = true;
         endPageSearch.disabled = true;
+        randomDifficulty.disabled = true;
+        randomPairButton.disabled = true;
     }
 
     data["players"].forEach(player => {
         roomSettingsPlayerList.appendChild(createPlayerListElement(player, player==localPlayer.name, player==data["owner"]))
     });
+    (data["spectators"] || []).forEach(spectator => {
+        let element = createPlayerListElement(spectator, false, false);
+        element.classList.add("spectator");
+        element.title = "Spectating";
+        roomSettingsPlayerList.appendChild(element);
+    });
     console.log(data["start_article"]);
     console.log(data["end_article"]);
 
@@ -345,8 +423,8 @@ function updateRoomSettings(data) {
         endPageSearch.classList.add("invalid-input");
     }
 
-    if (!data["waiting_for_players"]) {
-        setScene("roomSettings");
+    if (!data["waiting_for_players"] && data["state"] != "PLAYING") {
+        setScene("roomSettings"); // Mid race only the start and victory events change scenes
         roomData.waitingForPlayers = false;
     }
 
@@ -359,13 +437,17 @@ function connectToRoom(data) {
     if (data["status"] == "success") {
         localPlayer.name = data["username"]
         localPlayer.room = data["name"]
+        localPlayer.spectating = data["spectating"] == true;
         roomCodeSettings.value = data["code"];
         roomName.innerText = localPlayer.room;
+        spectateRoomName.innerText = localPlayer.room;
         setScene("roomSettings");
         startPageSearch.value = "";
         endPageSearch.value = "";
         clearChatMessages();
+        roomState = data;
         updateRoomSettings(data);
+        if (localPlayer.spectating && data["state"] == "PLAYING") setScene("spectate");
         
     } else {
         setScene("room");
@@ -373,6 +455,22 @@ function connectToRoom(data) {
     }
 }
 
+function applyRoomUpdate(data) {
+    if (data["status"] != "success") return;
+    if (data["full"]) {
+        roomState = data;
+    } else {
+        if (roomState == null || data["version"] <= roomState["version"]) return;
+        if (data["version"] != roomState["version"] + 1) {
+            socket.emit("resync_room"); // Missed an update, ask for a fresh snapshot
+            return;
+        }
+        Object.assign(roomState, data["changes"]);
+        roomState["version"] = data["version"];
+    }
+    updateRoomSettings(roomState);
+}
+
 function showRequestError(data) {
     sendNotification(data["error"]);
 }
@@ -403,11 +501,17 @@ socket.on("create_room", function(data) {
     connectToRoom(data);
 })
 socket.on("room_update", function(data) {
-    updateRoomSettings(data);
+    applyRoomUpdate(data);
 })
 socket.on("start", function(data) {
     console.log("Recieved start call with data " + data);
     console.log(data);
+    raceProgress.innerHTML = "";
+    spectateProgress.innerHTML = "";
+    if (localPlayer.spectating) {
+        setScene("spectate");
+        return;
+    }
     setScene(data["scene"]);
     
     loadPageFromData(data["start_title"]);
@@ -427,9 +531,20 @@ function loadPageFromData(page_id) {
     urlBar.innerText = "";
     pageRender.src = "about:blank";
     
+    let cached = pageCache.get(page_id);
+    if (cached !== undefined) {
+        pageCache.delete(page_id); // Move to the back of the eviction order
+        pageCache.set(page_id, cached);
+        urlBar.innerText = cached.title;
+        loadPage(cached.html);
+        return;
+    }
+
     getPageHTML(page_id).then(
         (content) => {
             if (content["success"]) {
+                pageCache.set(page_id, {"html": content.html, "title": content.title});
+                if (pageCache.size > pageCacheSize) pageCache.delete(pageCache.keys().next().value);
                 urlBar.innerText = content.title;
                 loadPage(content.html);
             } else {
@@ -439,17 +554,72 @@ function loadPageFromData(page_id) {
     );
 }
 
-socket.on("victory_race", function(data) {
-    victoryStatPagePath.innerHTML = "";
-    winnerName.innerText = data["winner_name"];
-    console.log(data["page_path"])
-    data["page_path"].push(roomData.endPage);
-    data["page_path"].forEach((page, i, arr) => {
+function formatElapsed(seconds) {
+    let minutes = Math.floor(seconds / 60);
+    let rest = Math.floor(seconds % 60);
+    return minutes + ":" + (rest < 10 ? "0" : "") + rest;
+}
+function createProgressRow(player) {
+    let row = document.createElement("div");
+    row.className = "progress-row";
+    [player["name"], player["page"], player["clicks"] + " clicks", player["moved_at"] == null ? "-" : formatElapsed(player["moved_at"])].forEach((text) => {
+        let cell = document.createElement("div");
+        cell.innerText = text;
+        row.appendChild(cell);
+    });
+    return row;
+}
+function showRaceProgress(data) {
+    // One snapshot per room per tick, sorted so the most active players come first
+    let players = data["players"].slice().sort((a, b) => b["clicks"] - a["clicks"]);
+    raceProgress.innerHTML = "";
+    spectateProgress.innerHTML = "";
+    players.forEach((player) => {
+        if (player["name"] != localPlayer.name) raceProgress.appendChild(createProgressRow(player));
+        spectateProgress.appendChild(createProgressRow(player));
+    });
+
+    let startedAt = Date.now() - data["elapsed"] * 1000;
+    if (raceClock != null) clearInterval(raceClock);
+    spectateElapsed.innerText = formatElapsed(data["elapsed"]);
+    raceClock = setInterval(() => {
+        if (!inGame) {
+            clearInterval(raceClock);
+            raceClock = null;
+            return;
+        }
+        spectateElapsed.innerText = formatElapsed((Date.now() - startedAt) / 1000);
+    }, 1000);
+}
+socket.on("race_progress", function(data) {
+    if (data["status"] == "success") showRaceProgress(data);
+})
+
+function showPathChips(targetElement, pages) {
+    targetElement.innerHTML = "";
+    pages.forEach((page, i, arr) => {
         let pathChip = document.createElement("div");
         pathChip.className = "path-chip";
         pathChip.innerText = page;
-        victoryStatPagePath.appendChild(pathChip);
+        targetElement.appendChild(pathChip);
     })
+}
+socket.on("victory_race", function(data) {
+    winnerName.innerText = data["winner_name"];
+    console.log(data["page_path"])
+    data["page_path"].push(roomData.endPage);
+    showPathChips(victoryStatPagePath, data["page_path"]);
+    victoryOptimalSummary.innerText = "Took " + data["clicks"] + " clicks, the best known route takes " + data["degrees"];
+    showPathChips(victoryOptimalPath, data["optimal_path"]);
+    let branches = data["abandoned_branches"] || [];
+    victoryAbandonedSummary.innerText = branches.length > 0 ? "Dead ends along the way" : "";
+    victoryAbandonedBranches.innerHTML = "";
+    branches.forEach((branch) => {
+        let row = document.createElement("div");
+        row.className = "path-row";
+        showPathChips(row, branch);
+        victoryAbandonedBranches.appendChild(row);
+    });
     setScene(data["scene"]);
 })
 socket.on("change_user_scene", function(data) {
@@ -459,8 +629,11 @@ socket.on("change_all_scenes", function(data) {
     setScene(data["scene"]);
 })
 
+function showBanned() {
+    document.body.innerHTML = "You have been banned from using this service. Have a nice day!";
+}
 socket.on("force_disconnect", function(data) {
-document.body.innerHTML = "You have been banned from using this service. Have a nice day!";
+    showBanned();
 })
 
 listenForErrorableEvent("change_username", function(data) {
@@ -468,10 +641,22 @@ listenForErrorableEvent("change_username", function(data) {
         sendNotification("Changed username");
 });
 
+listenForErrorableEvent("left_room", function(data) {
+    localPlayer.room = null;
+    localPlayer.spectating = false;
+    roomState = null;
+    setScene("room");
+    sendNotification("Left the room");
+}, absorbEvent);
+
 listenForErrorableEvent("search_pages", absorbEvent, (data) => {
     sendNotification("Couldn't find that page");
 });
 
+listenForErrorableEvent("random_pair", absorbEvent, absorbEvent);
+
+listenForErrorableEvent("autocomplete", showSuggestions, absorbEvent);
+
 listenForErrorableEvent("start_game_response", absorbEvent, (data) => {
     setScene("roomSettings");
 });
@@ -0,0 +1,86 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+class Transport:
+    POOL_HOSTS = 4 # Number of per-host pools kept alive
+    POOL_MAXSIZE = 16 # Max open connections per host
+    CONNECT_TIMEOUT = 3.05
+    READ_TIMEOUT = 10
+    RETRIES = 2
+    BACKOFF_FACTOR = 0.25
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    MAX_RETRY_AFTER = 2 # Seconds, a longer Retry-After isn't waited out while a player is kept waiting
+
+    def __init__(self, pool_maxsize: int = None, timeout: tuple = None, retries: int = None):
+        self.timeout = timeout if timeout is not None else (self.CONNECT_TIMEOUT, self.READ_TIMEOUT)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.retries = retries if retries is not None else self.RETRIES
+
+        # Only failed connects are retried in the adapter, they never reached upstream. Retrying on a
+        # status is a new request and has to go back through the scheduler, see retry_delay.
+        retry = Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=0,
+            status=0,
+            other=0,
+            allowed_methods=("GET",),
+            raise_on_status=False
+        )
+        # pool_block keeps us at pool_maxsize connections per host instead of opening throwaway ones
+        self.adapter = HTTPAdapter(
+            pool_connections=self.POOL_HOSTS,
+            pool_maxsize=pool_maxsize if pool_maxsize is not None else self.POOL_MAXSIZE,
+            max_retries=retry,
+            pool_block=True
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+    def get(self, url: str, headers: dict = None, params: dict = None) -> requests.Response:
+        with self.lock:
+            self.requests += 1
+        try:
+            return self.session.get(url, headers=headers, params=params, timeout=self.timeout)
+        except requests.RequestException:
+            with self.lock:
+                self.errors += 1
+            raise
+
+    def retry_delay(self, response: requests.Response, attempt: int) -> float|None:
+        # Seconds to wait before trying again after attempt (from 0), None when the response is final
+        if response.status_code not in self.RETRY_STATUSES or attempt >= self.retries:
+            return None
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is None:
+            return self.BACKOFF_FACTOR * 2 ** attempt
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            return self.BACKOFF_FACTOR * 2 ** attempt # An HTTP date, upstream doesn't send those
+        return delay if delay <= self.MAX_RETRY_AFTER else None
+
+    def stats(self) -> dict:
+        connections = 0
+        pooled_requests = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None: continue
+            connections += pool.num_connections
+            pooled_requests += pool.num_requests
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "connections_opened": connections,
+            "connections_reused": max(pooled_requests - connections, 0)
+        }
+
+    def close(self):
+        self.session.close()
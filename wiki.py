@@ -1,12 +1,23 @@
 import html
+import time
+import logging
+import metrics
 import json
-import requests
 from enum import Enum
+from transport import Transport
+from linkindex import LinkIndex
+from pagetable import pages
+from singleflight import Singleflight
+from scheduler import RequestScheduler
+from prefetch import Prefetcher
+from pathsolver import PathSolver
+from htmltransform import HTMLTransformer
+from popularity import Popularity
+from concurrent.futures import ThreadPoolExecutor, Future
+from pagecache import PageMetaCache, PageRecord, RenderedPage, RenderedPageCache, normalize_key
 from urllib.parse import unquote
 
-from typing import TYPE_CHECKING
-if TYPE_CHECKING:
-    from gamemanager import Player
+log = logging.getLogger(__name__)
 
 class Endpoint(Enum):
     SEARCH = "/search/page"
@@ -14,9 +25,18 @@ class Endpoint(Enum):
     GET_PAGE_OBJECT = "/page/_title_/bare"
 
 class PageMeta:
+    __slots__ = ("id",)
+
     def __init__(self, title, page_id):
-        self.title = title
-        self.page_id = page_id
+        self.id = pages.intern(page_id, title)
+
+    @property
+    def title(self) -> str:
+        return pages.title(self.id)
+
+    @property
+    def page_id(self) -> str:
+        return pages.key(self.id)
 
     def serialize(self):
         return {
@@ -25,18 +45,29 @@ class PageMeta:
         }
     
 class NoPage(PageMeta):
+    __slots__ = ()
+
     def __init__(self):
-        self.title = ""
-        self.page_id = ""
-        self.thumb = ""
+        super().__init__("", "")
 
 class WikipediaAPI:
     LANG_CODE = "en"
     USER_AGENT = "Wikipedia Speedrun Game/0.0 (boynegregg312@gmail.com) Requests/2.32.3"
     BASE_URL = "https://api.wikimedia.org/core/v1/wikipedia/"
-
-    def __init__(self):
-        pass
+    WORKERS = 16 # Threads handling navigation lookups off the socket handlers
+
+    def __init__(self, transport: Transport = None, page_cache: PageMetaCache = None, render_cache: RenderedPageCache = None, scheduler: RequestScheduler = None, transformer: HTMLTransformer = None, popularity: Popularity = None):
+        self.transformer = transformer if transformer is not None else HTMLTransformer() # First, it forks its workers
+        self.transport = transport if transport is not None else Transport()
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self.page_cache = page_cache if page_cache is not None else PageMetaCache()
+        self.render_cache = render_cache if render_cache is not None else RenderedPageCache()
+        self.popularity = popularity if popularity is not None else Popularity(store_path=None)
+        self.links = LinkIndex(pool=self.transformer.pool) # Compactions share the transform workers
+        self.inflight = Singleflight()
+        self.workers = ThreadPoolExecutor(max_workers=self.WORKERS, thread_name_prefix="wikipedia")
+        self.prefetcher = Prefetcher(self)
+        self.solver = PathSolver(self.links, self.transformer.pool)
 
     def construct_url(self, endpoint: Endpoint) -> str:
         return self.BASE_URL + self.LANG_CODE + endpoint.value
@@ -59,52 +90,119 @@ class WikipediaAPI:
             "params": args
         }
     
+    def request(self, endpoint: Endpoint, replacements: dict, key = None, **args):
+        # Upstream calls wait for budget at the priority of whoever is asking, see scheduler.prioritized.
+        # Retries wait for budget again, so a struggling upstream doesn't get more requests than the limit.
+        request = self.construct_request(endpoint, replacements, **args)
+        attempt = 0
+        while True:
+            self.scheduler.acquire(key)
+            started = time.perf_counter()
+            status = "error"
+            try:
+                response = self.transport.get(**request)
+                status = str(response.status_code)
+            finally:
+                metrics.upstream_seconds.observe(time.perf_counter() - started, endpoint=endpoint.name.lower(), status=status)
+
+            delay = self.transport.retry_delay(response, attempt)
+            if delay is None:
+                return response
+            log.debug("retrying upstream endpoint=%s status=%s in=%.2fs", endpoint.name.lower(), status, delay)
+            time.sleep(delay)
+            attempt += 1
+
     def search_pages(self, query: str, limit: int = 1) -> list:
-        response = requests.get(**self.construct_request(Endpoint.SEARCH, {}, q=query, limit=limit)).json()
+        response = self.request(Endpoint.SEARCH, {}, q=query, limit=limit).json()
         try: return response["pages"]
         except KeyError: return []
     
-    def process_page_request(self, key: str, player: 'Player', add_to_path: bool) -> bool:
-        response = requests.get(**self.construct_request(Endpoint.GET_PAGE_OBJECT, {"title": key}))
+    def fetch_page_object(self, key: str) -> PageRecord:
+        response = self.request(Endpoint.GET_PAGE_OBJECT, {"title": key}, ("object", key))
         page_data = response.json()
 
         if "httpCode" in page_data.keys() and page_data["httpCode"] == 404:
-            return False# Invalid request
-
-        print(page_data)
-        if add_to_path: player.page_path.append({"title": page_data["title"], "page_id": key})
-        return True
-
-    def get_page_content(self, key: str, player: 'Player' = None) -> str:
-        print("Download page:", key)
+            return PageRecord(key, missing=True)
 
-        response = requests.get(**self.construct_request(Endpoint.GET_PAGE_OBJECT, {"title": key}))
-        page_data = response.json()
-
-        if "httpCode" in page_data.keys() and page_data["httpCode"] == 404:
-            return "INVALID"
-
-        if player is not None:
-            print(page_data)
-            player.page_path.append({"title": page_data["title"], "page_id": key})
-        
+        redirect_target = ""
         if "redirect_target" in page_data.keys():
-            key = unquote(page_data["redirect_target"].split("/")[-2])
-
-        response = requests.get(**self.construct_request(Endpoint.GET_HTML, {"title": key}))
-
-        text = response.text.encode("ascii", "xmlcharrefreplace").decode("ascii")
-        text = (text
-                .replace('<base href="//en.wikipedia.org/wiki/"/>', "")
-                .replace("./", "https://en.wikipedia.org/wiki/")
-                .replace("/w/load.php", "https://en.wikipedia.org/w/load.php"))
-
-
-        return text
+            redirect_target = unquote(page_data["redirect_target"].split("/")[-2])
+
+        return PageRecord(key, page_data["title"], page_data.get("key", ""), redirect_target)
+
+    def submit(self, function, *args) -> Future:
+        return self.workers.submit(function, *args)
+
+    def get_page_object(self, key: str) -> PageRecord:
+        record = self.page_cache.get(key)
+        if record is None:
+            key = normalize_key(key)
+            self.scheduler.boost(("object", key))
+            record = self.inflight.do(("object", key), self._load_page_object, key)
+        return record
+
+    def _load_page_object(self, key: str) -> PageRecord:
+        record = self.page_cache.get(key)
+        if record is None:
+            record = self.fetch_page_object(key)
+            self.page_cache.put(record)
+        return record
+
+    def fetch_page_html(self, key: str) -> str:
+        response = self.request(Endpoint.GET_HTML, {"title": key}, ("html", key))
+        return response.text
+
+    def render_page(self, key: str) -> RenderedPage|None:
+        record = self.get_page_object(key)
+        if record.missing:
+            return None
+
+        if record.redirect_target != "":
+            target = self.get_page_object(record.redirect_target)
+            if target.missing:
+                return None
+            record = target
+
+        page = self.render_cache.get(record.key)
+        if page is None:
+            self.scheduler.boost(("html", record.key))
+            page = self.inflight.do(("html", record.key), self._load_rendered_page, record)
+        elif not self.links.has_page(record.key):
+            self.links.add_links(record.key, page.links) # Dropped from the link index by a compaction since
+
+        if record.key != normalize_key(key) and not self.links.has_page(key):
+            self.links.add_alias(key, record.key)
+        return page
+
+    def _load_rendered_page(self, record: PageRecord) -> RenderedPage:
+        page = self.render_cache.get(record.key)
+        if page is None:
+            log.debug("download page key=%s", record.key)
+            text = self.fetch_page_html(record.key)
+            lean_html, links = self.transformer.transform(record.key, text)
+            self.links.add_links(record.key, links) # Only links the player can see are legal moves
+            page = RenderedPage(record.key, record.title, lean_html, links)
+            self.render_cache.put(page)
+        return page
+
+    def title_of(self, key: str) -> str:
+        record = self.page_cache.get(key)
+        if record is not None and not record.missing:
+            return record.title
+        page_id = pages.lookup(key)
+        if page_id is not None:
+            return pages.title(page_id)
+        return key.replace("_", " ")
+
+    def is_valid_move(self, key: str, target: str) -> bool:
+        if not self.links.has_page(key) and self.render_page(key) is None:
+            return False
+        return self.links.has_link(key, target)
 
     def search_user_page_or_none(self, query: str) -> PageMeta|None:
         response = self.first_result_or_none(self.search_pages(query))
         if response is not None:
+            self.popularity.touch(response["key"])
             return PageMeta(response["title"], response["key"])
         return None
     
@@ -114,4 +212,4 @@ class WikipediaAPI:
         return None
 
 if __name__ == "__main__":
-    print(WikipediaAPI().get_page_content("Joe_Biden"))
\ No newline at end of file
+    print(WikipediaAPI().render_page("Joe_Biden").html.decode("utf-8"))
\ No newline at end of file